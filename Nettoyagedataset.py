@@ -8,9 +8,14 @@ en un dataset unique pour analyse et visualisation
 import pandas as pd
 import numpy as np
 from datetime import datetime
+import glob
+import json
+import os
 import warnings
 warnings.filterwarnings('ignore')
 
+from echantillonnage import build_stratified_sample
+
 def load_and_clean_data():
     """
     Charge et nettoie les 4 fichiers CSV d'accidents
@@ -321,21 +326,26 @@ def aggregate_usagers_vehicules(usagers, vehicules):
     
     return agg_usagers, agg_vehicules
 
-def create_severity_indicators(df):
+def create_severity_indicators(df, poids=(100, 30, 10), seuils=(10, 50, 200)):
     """
     Crée des indicateurs de gravité
+    
+    poids : (tué, blessé hospitalisé, blessé léger) ; seuils : bornes des catégories.
+    Valeurs par défaut identiques à BAREME_DEFAUT dans app.py, qui peut les recalculer.
     """
-    # Score de gravité (0-100)
+    poids_tue, poids_hospitalise, poids_leger = poids
+    
+    # Score de gravité (somme pondérée des victimes)
     df['score_gravite'] = (
-        df['nb_tues'].fillna(0) * 100 +
-        df['nb_blesses_hospitalises'].fillna(0) * 30 +
-        df['nb_blesses_legers'].fillna(0) * 10
+        df['nb_tues'].fillna(0) * poids_tue +
+        df['nb_blesses_hospitalises'].fillna(0) * poids_hospitalise +
+        df['nb_blesses_legers'].fillna(0) * poids_leger
     )
     
     # Catégorie de gravité
     df['categorie_gravite'] = pd.cut(
         df['score_gravite'],
-        bins=[0, 10, 50, 200, float('inf')],
+        bins=[0, *seuils, float('inf')],
         labels=['Matériel uniquement', 'Léger', 'Grave', 'Très grave']
     )
     
@@ -344,6 +354,46 @@ def create_severity_indicators(df):
     
     return df
 
+def write_partitions(df, dossier='accidents_partitions'):
+    """
+    Écrit le dataset partitionné par année-mois et par département (un Parquet par partition)
+    avec un manifeste JSON : le dashboard ne lit que les partitions couvertes par ses filtres
+    
+    Les partitions sont nommées 'AAAA-MM_<dep>.parquet' (données pluriannuelles : chaque
+    mois de chaque année a ses fichiers) ; les accidents sans date vont dans 'sans-date_<dep>'.
+    """
+    os.makedirs(dossier, exist_ok=True)
+    for ancien in glob.glob(os.path.join(dossier, '*.parquet')):
+        os.remove(ancien)
+    
+    dates = pd.to_datetime(df['date'], errors='coerce')
+    periode = dates.dt.strftime('%Y-%m').fillna('sans-date')
+    
+    # Codes département au format INSEE ('1' -> '01', '2A' et '971' inchangés)
+    dep = df['dep'].astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+    dep = dep.where(~dep.str.fullmatch(r'\d'), dep.str.zfill(2))
+    
+    # Une seule conversion Arrow : toutes les partitions partagent exactement le même schéma
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    
+    partitions = []
+    for (p, d), positions in sorted(df.groupby([periode.to_numpy(), dep.to_numpy()]).indices.items()):
+        fichier = f"{p}_{d}.parquet"
+        pq.write_table(table.take(positions), os.path.join(dossier, fichier))
+        partitions.append({'periode': p, 'dep': d, 'fichier': fichier, 'lignes': len(positions)})
+    
+    manifeste = {
+        'date_min': str(dates.min().date()) if dates.notna().any() else None,
+        'date_max': str(dates.max().date()) if dates.notna().any() else None,
+        'partitions': partitions
+    }
+    with open(os.path.join(dossier, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=1)
+    
+    return len(partitions)
+
 def main():
     """
     Fonction principale de consolidation
@@ -439,6 +489,30 @@ def main():
         print(f"\n💾 Sauvegarde du fichier consolidé: {output_file}")
         accidents_final.to_csv(output_file, index=False, encoding='utf-8')
         
+        # Version colonnaire pour le moteur DuckDB du dashboard (nécessite pyarrow)
+        parquet_file = 'accidents_routiers_2024_consolide.parquet'
+        try:
+            accidents_final.to_parquet(parquet_file, index=False)
+            print(f"💾 Version Parquet: {parquet_file}")
+            n_partitions = write_partitions(accidents_final)
+            print(f"💾 Partitions année-mois x département: accidents_partitions/ ({n_partitions} fichiers)")
+        except (ImportError, ValueError, TypeError) as e:
+            print(f"⚠️ Export Parquet ignoré: {e}")
+        
+        # Échantillon stratifié pondéré (aperçu immédiat du dashboard, écrit après le CSV consolidé)
+        echantillon_file = 'accidents_echantillon_stratifie.csv'
+        echantillon = build_stratified_sample(accidents_final)
+        echantillon.to_csv(echantillon_file, index=False, encoding='utf-8')
+        print(f"📄 Échantillon stratifié créé: {echantillon_file} ({len(echantillon):,} lignes)")
+
+        # Création d'un échantillon pour tests
+        sample_file = 'accidents_sample.csv'
+        sample_size = min(1000, len(accidents_final))
+        if sample_size > 0:
+            sample = accidents_final.sample(sample_size)
+            sample.to_csv(sample_file, index=False, encoding='utf-8')
+            print(f"📄 Échantillon de test créé: {sample_file} ({len(sample)} lignes)")
+        
         # Statistiques finales
         print("\n📈 STATISTIQUES DU DATASET CONSOLIDÉ:")
         print("=" * 60)
@@ -459,14 +533,6 @@ def main():
         print(f"\n✨ Consolidation terminée avec succès!")
         print("=" * 60)
         
-        # Création d'un échantillon pour tests
-        sample_file = 'accidents_sample.csv'
-        sample_size = min(1000, len(accidents_final))
-        if sample_size > 0:
-            sample = accidents_final.sample(sample_size)
-            sample.to_csv(sample_file, index=False, encoding='utf-8')
-            print(f"\n📄 Échantillon de test créé: {sample_file} ({len(sample)} lignes)")
-        
         return accidents_final
         
     except Exception as e:
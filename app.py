@@ -1,18 +1,36 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import folium
-from streamlit_folium import st_folium
-from datetime import datetime, timedelta
+from datetime import datetime
 import warnings
 import time
+import base64
+import cProfile
 import hashlib
-import uuid  # AJOUTER CETTE LIGNE
+import io
+import json
+import os
+import pstats
+import re
+import struct
+import threading
+import tracemalloc
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait
 warnings.filterwarnings('ignore')
 
+from echantillonnage import build_stratified_sample
+
+# Arrow : dataset mappé en mémoire (IPC) ; pyarrow.dataset (lecture groupée des
+# partitions Parquet) n'est chargé qu'à la première lecture de partitions
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -24,6 +42,155 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Fichier consolidé produit par Nettoyagedataset.py
+DATA_FILE = 'accidents_routiers_2024_consolide.csv'
+
+# Couche de requêtes : 'pandas' (défaut) ou 'duckdb' (agrégations poussées sur le Parquet)
+QUERY_BACKEND = os.environ.get('ACCIDENTS_BACKEND', 'pandas').lower()
+PARQUET_FILE = 'accidents_routiers_2024_consolide.parquet'
+
+# Stockage partitionné (année-mois x département) produit par Nettoyagedataset.write_partitions,
+# lu tant que la base complète n'est pas prête : les partitions lues sont gardées dans un LRU
+# partagé par les sessions du processus, borné en lignes
+PARTITIONS_DIR = 'accidents_partitions'
+PARTITIONS_MANIFEST = os.path.join(PARTITIONS_DIR, 'manifest.json')
+PARTITIONS_LRU_LIGNES = 1_000_000
+PARTITIONS_ASSEMBLEES_MAX = 4  # ensembles de partitions préparés gardés en cache
+
+# Copie Arrow IPC (non compressée) du DataFrame préparé : ouverte par memory-map, elle est
+# partagée via le cache de pages par tous les processus Streamlit de la machine
+ARROW_FILE = 'accidents_routiers_2024_consolide.arrow'
+
+# Rendu progressif : échantillon stratifié affiché pendant le chargement complet
+ECHANTILLON_FILE = 'accidents_echantillon_stratifie.csv'
+APERCU_DELAI_S = 0.3  # attente maximale de la base complète avant d'afficher l'aperçu
+
+# Préchauffage des caches : journal des états de filtres et nombre d'états récents préchauffés
+USAGE_LOG_FILE = 'usage_filtres.jsonl'
+WARMER_ETATS_RECENTS = 5
+GRAVITE_OPTIONS = ['Mortels', 'Blessés graves', 'Blessés légers', 'Matériels']
+
+# Série temporelle : granularité jour jusqu'à ~1 an, semaine jusqu'à ~5 ans, puis mois ;
+# budget de points des courbes (LTTB) et seuil de passage en WebGL
+TIMESERIES_MAX_JOURS = 400
+TIMESERIES_MAX_SEMAINES = 260
+TIMESERIES_MAX_POINTS = 1000
+TIMESERIES_WEBGL_SEUIL = 1500
+
+# Mode debug (rapport mémoire et chronométrage des blocs dans la sidebar) :
+# ACCIDENTS_DEBUG=1 ou paramètre d'URL ?debug=1 ; les mesures sont ajoutées au journal
+DEBUG = os.environ.get('ACCIDENTS_DEBUG', '').lower() in ('1', 'true', 'oui')
+PERF_LOG_FILE = 'perf_debug.jsonl'
+
+# Profilage (cProfile + tracemalloc) d'un rerun complet ou d'un bloc de perf_block :
+# ACCIDENTS_PROFILE=rerun|<bloc> ou paramètre d'URL ?profil=... ; rapports dans PROFILE_DIR
+PROFILE_CIBLE = os.environ.get('ACCIDENTS_PROFILE', '')
+PROFILE_DIR = os.environ.get('ACCIDENTS_PROFILE_DIR', 'profils')
+PROFILE_TOP_ALLOCATIONS = 25
+PROFILE_TOP_FONCTIONS = 30
+
+# Représentation compacte : colonnes calendaires (int8), indicateurs binaires (bool),
+# colonnes texte en catégories tant que les valeurs distinctes restent minoritaires
+COLONNES_CALENDRIER = ['mois', 'jour_semaine', 'trimestre']
+COLONNES_INDICATEURS = ['accident_mortel', 'est_weekend']
+CATEGORIE_RATIO_MAX = 0.5
+
+# Classes de gravité (mêmes bornes que Nettoyagedataset.create_severity_indicators)
+CATEGORIES_GRAVITE = ['Matériel uniquement', 'Léger', 'Grave', 'Très grave']
+
+# Barème de gravité : poids (tués, blessés hospitalisés, blessés légers) et bornes des
+# classes ; le barème par défaut est celui du fichier consolidé
+COLONNES_VICTIMES = ['nb_tues', 'nb_blesses_hospitalises', 'nb_blesses_legers']
+BAREME_DEFAUT = ((100, 30, 10), (10, 50, 200))
+# Barèmes proposés dans la sidebar (valeurs de départ, modifiables) ; le coût
+# socio-économique reprend les valeurs tutélaires de l'ONISR rapportées à un tué
+# (blessé hospitalisé 12,5 %, blessé léger 0,5 %)
+BAREMES_GRAVITE = {
+    'Standard (100 / 30 / 10)': BAREME_DEFAUT,
+    'Coût socio-économique (ONISR)': ((100, 12.5, 0.5), (1, 12.5, 100))
+}
+
+# Saison météorologique de chaque mois
+SAISONS = {
+    12: 'Hiver', 1: 'Hiver', 2: 'Hiver',
+    3: 'Printemps', 4: 'Printemps', 5: 'Printemps',
+    6: 'Été', 7: 'Été', 8: 'Été',
+    9: 'Automne', 10: 'Automne', 11: 'Automne'
+}
+
+# Paramètres cartographiques (emprise identique au filtre GPS de load_data)
+FRANCE_CENTRE = [46.603354, 1.888334]
+FRANCE_LAT = (41.0, 52.0)
+FRANCE_LONG = (-5.0, 10.0)
+ZOOM_FRANCE = 6
+
+# Grille de la heatmap : taille d'une cellule en pixels écran et plafond de cellules
+HEATMAP_CELL_PX = 8
+HEATMAP_MAX_CELLS = 250_000
+
+# Bandes de zoom de la grille : une couche pré-agrégée par bande, celle affichée suit le
+# zoom du navigateur (au-delà de zoom 8, HEATMAP_MAX_CELLS plafonne déjà la résolution)
+HEATMAP_BANDES_ZOOM = (6, 7, 8)
+
+# Mode points : budget de points de la heatmap (celui de l'ancien échantillon aléatoire,
+# pour ne pas alourdir la carte), taille des strates spatiales (degrés) et part minimale
+# du budget laissée à l'échantillon de densité (accidents non graves)
+POINTS_BUDGET = 5_000
+POINTS_STRATE_DEG = 0.25
+POINTS_PART_DENSITE = 0.2
+
+# Raster de densité : largeur de l'image (px), lissage gaussien (px) et dégradé de couleurs
+RASTER_LARGEUR = 600
+RASTER_SIGMA_PX = 2.0
+HEATMAP_GRADIENT = {0.0: 'blue', 0.5: 'yellow', 0.8: 'orange', 1.0: 'red'}
+
+# Surface de risque (estimation par noyau, convolution FFT) : largeur de la grille (px,
+# ~1 km), bande passante par défaut (m), noyaux et pondérations proposés
+KDE_LARGEUR = 1200
+KDE_BANDE_DEFAUT_M = 3000
+KDE_NOYAUX = {'Gaussien': 'gaussien', 'Epanechnikov': 'epanechnikov', 'Quartique': 'quartique'}
+KDE_PONDERATIONS = {'Gravité (score)': 'score_gravite', 'Décès': 'nb_tues', 'Accidents': None}
+
+# Points noirs : rayon de regroupement (m), nombre minimal d'accidents et nombre affiché par défaut
+HOTSPOT_RAYON_M = 150
+HOTSPOT_MIN_ACCIDENTS = 2
+HOTSPOT_TOP_DEFAUT = 20
+
+# Recherche autour d'un point : taille des cellules de l'index spatial (m), rayon et
+# nombre de voisins par défaut, lignes par page et marqueurs affichés au plus
+RECHERCHE_CELLULE_M = 1000
+RECHERCHE_RAYON_DEFAUT = 500
+RECHERCHE_K_DEFAUT = 20
+RECHERCHE_PAGE = 25
+RECHERCHE_MARQUEURS_MAX = 500
+
+# Contours des départements (GeoJSON local, propriété 'code') et version simplifiée
+# servie en statique par Streamlit (server.enableStaticServing) : les figures ne
+# transportent que les codes et les valeurs, jamais les polygones
+DEPARTEMENTS_GEOJSON = os.path.join('data', 'departements.geojson')
+DEPARTEMENTS_STATIQUE = os.path.join('static', 'departements_simplifie.geojson')
+DEPARTEMENTS_URL = 'app/static/departements_simplifie.geojson'
+GEOMETRIE_DECIMALES = 2  # ~1 km : largement suffisant à l'échelle de la France
+
+# Découpage administratif : régions (2016) et leurs départements
+REGIONS_DEPARTEMENTS = {
+    'Auvergne-Rhône-Alpes': ['01', '03', '07', '15', '26', '38', '42', '43', '63', '69', '73', '74'],
+    'Bourgogne-Franche-Comté': ['21', '25', '39', '58', '70', '71', '89', '90'],
+    'Bretagne': ['22', '29', '35', '56'],
+    'Centre-Val de Loire': ['18', '28', '36', '37', '41', '45'],
+    'Corse': ['2A', '2B'],
+    'Grand Est': ['08', '10', '51', '52', '54', '55', '57', '67', '68', '88'],
+    'Hauts-de-France': ['02', '59', '60', '62', '80'],
+    'Île-de-France': ['75', '77', '78', '91', '92', '93', '94', '95'],
+    'Normandie': ['14', '27', '50', '61', '76'],
+    'Nouvelle-Aquitaine': ['16', '17', '19', '23', '24', '33', '40', '47', '64', '79', '86', '87'],
+    'Occitanie': ['09', '11', '12', '30', '31', '32', '34', '46', '48', '65', '66', '81', '82'],
+    'Pays de la Loire': ['44', '49', '53', '72', '85'],
+    "Provence-Alpes-Côte d'Azur": ['04', '05', '06', '13', '83', '84'],
+    'Outre-mer': ['971', '972', '973', '974', '975', '976', '977', '978', '986', '987', '988']
+}
+DEPARTEMENT_REGION = {dep: region for region, deps in REGIONS_DEPARTEMENTS.items() for dep in deps}
+
 # ============================================================================
 # STYLES CSS PERSONNALISÉS
 # ============================================================================
@@ -172,119 +339,1083 @@ st.markdown("""
 # FONCTIONS UTILITAIRES
 # ============================================================================
 
-def load_data():
+def load_data(path=DATA_FILE):
     """Charge et prépare les données consolidées"""
     try:
         # Charger le fichier consolidé
-        df = pd.read_csv('accidents_routiers_2024_consolide.csv', low_memory=False)
-        
-        # Conversion des types
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        
-        # Nettoyage des coordonnées GPS
-        if 'lat' in df.columns and 'long' in df.columns:
-            df['lat'] = pd.to_numeric(df['lat'], errors='coerce')
-            df['long'] = pd.to_numeric(df['long'], errors='coerce')
-            # Filtrer les coordonnées France métropolitaine
-            df = df[(df['lat'].between(41, 52, inclusive='both')) | df['lat'].isna()]
-            df = df[(df['long'].between(-5, 10, inclusive='both')) | df['long'].isna()]
-        
-        # Ajout de colonnes calculées si nécessaires
-        if 'score_gravite' not in df.columns and all(col in df.columns for col in ['nb_tues', 'nb_blesses_hospitalises', 'nb_blesses_legers']):
-            df['score_gravite'] = (
-                df['nb_tues'].fillna(0) * 100 +
-                df['nb_blesses_hospitalises'].fillna(0) * 30 +
-                df['nb_blesses_legers'].fillna(0) * 10
-            )
+        df = pd.read_csv(path, low_memory=False)
+    except FileNotFoundError:
+        st.error(f"❌ Fichier '{path}' non trouvé!")
+        st.info("💡 Assurez-vous d'avoir exécuté le script de consolidation d'abord.")
+        return pd.DataFrame()
+    
+    return prepare_data(df)
+
+def prepare_data(df):
+    """Typage, colonnes calculées et représentation compacte d'un extrait brut"""
+    # Conversion des types
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    
+    # Nettoyage des coordonnées GPS
+    if 'lat' in df.columns and 'long' in df.columns:
+        df['lat'] = pd.to_numeric(df['lat'], errors='coerce')
+        df['long'] = pd.to_numeric(df['long'], errors='coerce')
+        # Filtrer les coordonnées France métropolitaine
+        df = df[(df['lat'].between(41, 52, inclusive='both')) | df['lat'].isna()]
+        df = df[(df['long'].between(-5, 10, inclusive='both')) | df['long'].isna()]
+    
+    # Ajout de colonnes calculées si nécessaires
+    if 'score_gravite' not in df.columns and all(col in df.columns for col in COLONNES_VICTIMES):
+        df['score_gravite'] = severity_score(df, BAREME_DEFAUT[0])
+    
+    if 'accident_mortel' not in df.columns and 'nb_tues' in df.columns:
+        df['accident_mortel'] = (df['nb_tues'] > 0).astype(int)
+    
+    # Ajout des colonnes temporelles basées sur la date uniquement
+    if 'date' in df.columns and not df['date'].isna().all():
+        df['mois'] = df['date'].dt.month
+        df['jour_semaine'] = df['date'].dt.dayofweek  # 0 = Lundi, 6 = Dimanche
+        df['nom_jour'] = df['date'].dt.day_name()
+        df['nom_mois'] = df['date'].dt.month_name()
+        df['trimestre'] = df['date'].dt.quarter
         
-        if 'accident_mortel' not in df.columns and 'nb_tues' in df.columns:
-            df['accident_mortel'] = (df['nb_tues'] > 0).astype(int)
+        # Saison météorologique
+        df['saison'] = df['mois'].map(SAISONS)
         
-        # Ajout des colonnes temporelles basées sur la date uniquement
-        if 'date' in df.columns and not df['date'].isna().all():
-            df['mois'] = df['date'].dt.month
-            df['jour_semaine'] = df['date'].dt.dayofweek  # 0 = Lundi, 6 = Dimanche
-            df['nom_jour'] = df['date'].dt.day_name()
-            df['nom_mois'] = df['date'].dt.month_name()
-            df['trimestre'] = df['date'].dt.quarter
-            
-            # Saison météorologique
-            df['saison'] = df['mois'].map({
-                12: 'Hiver', 1: 'Hiver', 2: 'Hiver',
-                3: 'Printemps', 4: 'Printemps', 5: 'Printemps',
-                6: 'Été', 7: 'Été', 8: 'Été',
-                9: 'Automne', 10: 'Automne', 11: 'Automne'
-            })
-            
-            # Weekend
-            df['est_weekend'] = (df['jour_semaine'] >= 5).astype(int)
+        # Weekend
+        df['est_weekend'] = (df['jour_semaine'] >= 5).astype(int)
+    
+    # Créer les colonnes de types de véhicules si elles n'existent pas
+    if 'nb_2roues' in df.columns and 'implique_2roues' not in df.columns:
+        df['implique_2roues'] = (df['nb_2roues'] > 0).astype(int)
+    
+    if 'nb_pl' in df.columns and 'implique_pl' not in df.columns:
+        df['implique_pl'] = (df['nb_pl'] > 0).astype(int)
+    
+    if 'nb_tc' in df.columns and 'implique_tc' not in df.columns:
+        df['implique_tc'] = (df['nb_tc'] > 0).astype(int)
+    
+    if 'nb_edp' in df.columns and 'implique_edp' not in df.columns:
+        df['implique_edp'] = (df['nb_edp'] > 0).astype(int)
+    
+    # Ajouter VL si disponible
+    if 'nb_vl' in df.columns and 'implique_vl' not in df.columns:
+        df['implique_vl'] = (df['nb_vl'] > 0).astype(int)
+    
+    # Représentation mémoire compacte
+    memoire_brute = df.memory_usage(deep=True).sum() if DEBUG else None
+    df = compact_dataframe(df)
+    if DEBUG:
+        df.attrs['memoire_brute'] = memoire_brute
+    
+    return df
+
+def compact_dataframe(df):
+    """Réduit l'empreinte mémoire du DataFrame
+
+    Texte -> catégories, comptages -> petits entiers (float32 s'il reste des NaN),
+    indicateurs 0/1 -> booléens, coordonnées -> float32.
+    """
+    df = df.reset_index(drop=True)
+    
+    for col in df.columns:
+        serie = df[col]
         
-        # Créer les colonnes de types de véhicules si elles n'existent pas
-        if 'nb_2roues' in df.columns and 'implique_2roues' not in df.columns:
-            df['implique_2roues'] = (df['nb_2roues'] > 0).astype(int)
+        if col == 'categorie_gravite':
+            df[col] = pd.Categorical(serie, categories=CATEGORIES_GRAVITE, ordered=True)
         
-        if 'nb_pl' in df.columns and 'implique_pl' not in df.columns:
-            df['implique_pl'] = (df['nb_pl'] > 0).astype(int)
+        elif serie.dtype == object:
+            if serie.nunique(dropna=True) <= CATEGORIE_RATIO_MAX * len(serie):
+                df[col] = serie.astype('category')
         
-        if 'nb_tc' in df.columns and 'implique_tc' not in df.columns:
-            df['implique_tc'] = (df['nb_tc'] > 0).astype(int)
+        elif col.startswith('nb_') and pd.api.types.is_numeric_dtype(serie):
+            if serie.isna().any():
+                df[col] = serie.astype(np.float32)
+            else:
+                # int16 minimum : évite les débordements des calculs de score (x100)
+                df[col] = serie.astype(np.int16 if serie.abs().max() < 2**15 else np.int32)
         
-        if 'nb_edp' in df.columns and 'implique_edp' not in df.columns:
-            df['implique_edp'] = (df['nb_edp'] > 0).astype(int)
+        elif col in COLONNES_INDICATEURS or col.startswith('implique_'):
+            if pd.api.types.is_numeric_dtype(serie) and serie.notna().all() and serie.isin([0, 1]).all():
+                df[col] = serie.astype(bool)
         
-        # Ajouter VL si disponible
-        if 'nb_vl' in df.columns and 'implique_vl' not in df.columns:
-            df['implique_vl'] = (df['nb_vl'] > 0).astype(int)
+        elif col in COLONNES_CALENDRIER and pd.api.types.is_integer_dtype(serie):
+            df[col] = serie.astype(np.int8)
         
+        elif col in ('lat', 'long'):
+            df[col] = serie.astype(np.float32)
+    
+    return df
+
+def memory_report(df):
+    """Empreinte mémoire par colonne (Mo), triée par taille décroissante"""
+    usage = df.memory_usage(deep=True, index=False)
+    rapport = pd.DataFrame({'Type': df.dtypes.astype(str), 'Mo': usage / 1e6})
+    return rapport.sort_values('Mo', ascending=False)
+
+def get_dataset_version(path=DATA_FILE):
+    """Empreinte du fichier de données (taille + date de modification)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'absent'
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def department_options(df):
+    """Codes département (format INSEE) présents dans les données"""
+    if 'dep' not in df.columns:
+        return []
+    if isinstance(df['dep'].dtype, pd.CategoricalDtype):
+        valeurs = pd.Series(df['dep'].cat.categories)
+    else:
+        valeurs = pd.Series(df['dep'].dropna().unique())
+    return sorted(set(normalize_department_codes(valeurs)) - {''})
+
+def department_mask(serie, departements):
+    """Masque des lignes dont le département normalisé est dans `departements`"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Normalisation sur les seules catégories, puis lecture par code
+        garde = normalize_department_codes(pd.Series(serie.cat.categories)).isin(departements).to_numpy()
+        codes = serie.cat.codes.to_numpy()
+        return np.where(codes >= 0, garde[codes], False)
+    return normalize_department_codes(serie).isin(departements).to_numpy()
+
+def apply_filters(df, date_range, gravite_options, departements=()):
+    """Applique les filtres de la sidebar (période, départements et types d'accidents)"""
+    if date_range is not None and len(date_range) == 2:
+        mask = (df['date'] >= pd.to_datetime(date_range[0])) & (df['date'] <= pd.to_datetime(date_range[1]))
+        df_filtered = df[mask]
+    else:
+        df_filtered = df.copy()
+    
+    if departements and 'dep' in df_filtered.columns:
+        df_filtered = df_filtered[department_mask(df_filtered['dep'], departements)]
+    
+    # Appliquer les filtres gravité - logique simplifiée
+    # Par défaut, on garde tout si tous les types sont sélectionnés
+    if len(gravite_options) == 4:
+        # Tous sélectionnés = pas de filtre
+        pass
+    else:
+        # Filtrer selon les sélections
+        if 'Mortels' not in gravite_options:
+            df_filtered = df_filtered[df_filtered.get('accident_mortel', 0) == 0]
+        
+        if 'Blessés graves' not in gravite_options:
+            df_filtered = df_filtered[df_filtered.get('nb_blesses_hospitalises', 0) == 0]
+        
+        if 'Blessés légers' not in gravite_options:
+            df_filtered = df_filtered[df_filtered.get('nb_blesses_legers', 0) == 0]
+    
+    # État des filtres attaché au résultat : la couche de requêtes peut le pousser vers DuckDB
+    df_filtered.attrs['filtres'] = make_filter_state(date_range, gravite_options, departements)
+    return df_filtered
+
+def make_filter_state(date_range, gravite_options, departements=()):
+    """Représentation hashable et stable de l'état des filtres de la sidebar"""
+    dates = tuple(str(d) for d in date_range) if date_range is not None else ()
+    return (dates, tuple(sorted(gravite_options)), tuple(sorted(departements)))
+
+def severity_score(df, poids):
+    """Score de gravité par accident : somme pondérée des tués, blessés hospitalisés et légers"""
+    score = np.zeros(len(df))
+    for colonne, poids_colonne in zip(COLONNES_VICTIMES, poids):
+        score += df[colonne].fillna(0).to_numpy(dtype=np.float64) * poids_colonne
+    return pd.Series(score, index=df.index)
+
+def severity_category(score, seuils):
+    """Classe de gravité : intervalles ]0, s1], ]s1, s2], ]s2, s3], ]s3, inf[ (score nul : NaN)"""
+    return pd.cut(score, bins=[0, *seuils, np.inf], labels=CATEGORIES_GRAVITE)
+
+def apply_severity_scale(df, bareme):
+    """Recalcule score_gravite et categorie_gravite selon le barème (poids, seuils)
+
+    Simple somme pondérée des comptes de victimes déjà en mémoire, sans relecture
+    des données ; avec le barème par défaut, le DataFrame est renvoyé tel quel.
+    """
+    if not all(col in df.columns for col in COLONNES_VICTIMES):
+        return df
+    if bareme == BAREME_DEFAUT and {'score_gravite', 'categorie_gravite'} <= set(df.columns):
         return df
     
-    except FileNotFoundError:
-        st.error("❌ Fichier 'accidents_routiers_2024_consolide.csv' non trouvé!")
-        st.info("💡 Assurez-vous d'avoir exécuté le script de consolidation d'abord.")
-        return pd.DataFrame()
+    poids, seuils = bareme
+    # Copie superficielle : les colonnes remplacées ne touchent pas le DataFrame en cache
+    df = df.copy(deep=False)
+    df['score_gravite'] = severity_score(df, poids)
+    df['categorie_gravite'] = severity_category(df['score_gravite'], seuils)
+    df.attrs['bareme'] = bareme
+    return df
 
-def create_time_series_chart(df):
-    """Crée un graphique de série temporelle interactif"""
-    if df.empty or 'date' not in df.columns:
-        return go.Figure()
+def severity_scale_sidebar():
+    """Paramètres du barème de gravité dans la sidebar ; retourne (poids, seuils)"""
+    with st.sidebar.expander("⚖️ Barème de gravité"):
+        nom = st.selectbox("Barème de départ", options=list(BAREMES_GRAVITE), key='bareme_nom')
+        (poids_tue, poids_hosp, poids_leger), seuils_depart = BAREMES_GRAVITE[nom]
+        
+        # Clés liées au barème de départ : en changer réinitialise les valeurs
+        st.caption("Poids par victime")
+        poids = (
+            st.number_input("Tué", min_value=0.0, value=float(poids_tue), step=1.0, key=f'poids_tue_{nom}'),
+            st.number_input("Blessé hospitalisé", min_value=0.0, value=float(poids_hosp), step=0.5,
+                            key=f'poids_hosp_{nom}'),
+            st.number_input("Blessé léger", min_value=0.0, value=float(poids_leger), step=0.5,
+                            key=f'poids_leger_{nom}')
+        )
+        st.caption("Bornes des classes (score)")
+        seuils = tuple(
+            st.number_input(f"{categorie} jusqu'à", min_value=0.0, value=float(seuil), step=1.0,
+                            key=f'seuil_{i}_{nom}')
+            for i, (categorie, seuil) in enumerate(zip(CATEGORIES_GRAVITE, seuils_depart))
+        )
+        if not 0 < seuils[0] < seuils[1] < seuils[2]:
+            st.warning("Bornes non croissantes : bornes par défaut utilisées")
+            seuils = BAREME_DEFAUT[1]
+    
+    # Barème normalisé (entiers si possible) : même clé de cache pour des valeurs égales
+    def normaliser(valeurs):
+        return tuple(int(v) if float(v).is_integer() else float(v) for v in valeurs)
+    
+    return normaliser(poids), normaliser(seuils)
+
+@st.cache_data(show_spinner=False)
+def load_partition_manifest(version):
+    """Manifeste du stockage partitionné, ou None s'il n'existe pas"""
+    if version == 'absent':
+        return None
+    try:
+        with open(PARTITIONS_MANIFEST, encoding='utf-8') as f:
+            manifeste = json.load(f)
+    except (OSError, ValueError):
+        return None
+    partitions = manifeste.get('partitions')
+    # Ancien format (partitions par mois de l'année seul) : ignoré jusqu'à la prochaine consolidation
+    if not partitions or 'periode' not in partitions[0]:
+        return None
+    return manifeste
+
+def select_partitions(manifeste, date_range, departements=()):
+    """Fichiers des partitions couvrant les filtres (élagage avant toute lecture disque)
+
+    Élagage par année-mois ('AAAA-MM') : sur plusieurs années, une période d'un mois ne
+    lit que ce mois-là.
+    """
+    periodes = None
+    if date_range is not None and len(date_range) == 2:
+        periodes = set(pd.period_range(pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1]),
+                                       freq='M').strftime('%Y-%m'))
+    return [p['fichier'] for p in manifeste['partitions']
+            if (periodes is None or p['periode'] in periodes) and (not departements or p['dep'] in departements)]
+
+def read_partitions(fichiers):
+    """Lit des partitions en un seul scan Arrow multi-thread, puis les sépare par fichier"""
+    chemins = [os.path.join(PARTITIONS_DIR, f) for f in fichiers]
+    if pa is None or len(chemins) < 2:
+        return {f: pd.read_parquet(c) for f, c in zip(fichiers, chemins)}
+    
+    import pyarrow.dataset as pads
+    dataset = pads.dataset(chemins, format='parquet')
+    table = dataset.to_table(columns=dataset.schema.names + ['__filename'])
+    df = table.to_pandas()
+    par_chemin = df.pop('__filename').to_numpy()
+    groupes = pd.Series(np.arange(len(df))).groupby(par_chemin).indices
+    return {f: df.iloc[groupes[c]].reset_index(drop=True) if c in groupes else df.iloc[:0]
+            for f, c in zip(fichiers, chemins)}
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_partition_store(version):
+    """LRU des partitions brutes déjà lues, partagé par toutes les sessions du processus"""
+    return {'verrou': threading.Lock(), 'lru': OrderedDict(), 'lignes': 0}
+
+@st.cache_resource(show_spinner=False, max_entries=PARTITIONS_ASSEMBLEES_MAX)
+def load_partitions(version, fichiers):
+    """Assemble et prépare les partitions demandées, une seule fois par processus
+
+    Seules les partitions absentes du LRU partagé sont lues ; au-delà de
+    PARTITIONS_LRU_LIGNES, les moins récemment utilisées sont libérées.
+    """
+    magasin = get_partition_store(version)
+    with magasin['verrou']:
+        lru = magasin['lru']
+        manquantes = [f for f in fichiers if f not in lru]
+        for fichier, partition in read_partitions(manquantes).items():
+            lru[fichier] = partition
+            magasin['lignes'] += len(partition)
+        morceaux = []
+        for fichier in fichiers:
+            lru.move_to_end(fichier)
+            morceaux.append(lru[fichier])
+        # Les partitions de la demande en cours (en fin de LRU) ne sont jamais libérées
+        while magasin['lignes'] > PARTITIONS_LRU_LIGNES and len(lru) > len(fichiers):
+            magasin['lignes'] -= len(lru.popitem(last=False)[1])
+    
+    return prepare_data(pd.concat(morceaux, ignore_index=True)) if morceaux else pd.DataFrame()
+
+def make_map_key(prefix, version, filtres, params=(), bareme=BAREME_DEFAUT):
+    """Clé stable d'une carte : identique tant que données, filtres, barème et paramètres le sont"""
+    empreinte = hashlib.sha1(repr((version, filtres, bareme, params)).encode()).hexdigest()[:12]
+    return f"{prefix}_{empreinte}"
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def render_map_html(map_key, _builder, _df, params):
+    """Construit et sérialise une carte une seule fois par clé (HTML mis en cache côté serveur)
+
+    `map_key` identifie la version des données et l'état des filtres ; `_builder` et
+    `_df` (exclus du hachage) servent uniquement au premier calcul.
+    """
+    note_cache_miss()
+    m = _builder(_df, **dict(params))
+    if m is None:
+        return None
+    return m.get_root().render()
+
+def display_map(html, height=600):
+    """Affiche une carte déjà sérialisée ; un HTML identique n'est ni remonté ni renvoyé"""
+    with perf_block("carte") as mesure:
+        mesure['payload_ko'] = round(len(html) / 1024, 1)
+        if hasattr(st, 'iframe'):
+            st.iframe(html, height=height)
+        else:
+            # Streamlit antérieur à st.iframe : API des composants (dépréciée ensuite)
+            import streamlit.components.v1 as components
+            components.html(html, height=height)
+
+# ============================================================================
+# MESURES DE PERFORMANCE (MODE DEBUG)
+# ============================================================================
+
+# Mesures du rerun en cours : chaque session exécute le script dans son propre thread
+_perf = threading.local()
+
+def is_debug_mode():
+    """Mode debug actif : variable d'environnement ou paramètre d'URL ?debug=1"""
+    return DEBUG or st.query_params.get('debug', '').lower() in ('1', 'true', 'oui')
+
+def start_perf_run(actif):
+    """Démarre l'enregistrement des mesures du rerun (aucun coût si `actif` est faux)"""
+    _perf.mesures = [] if actif else None
+    _perf.cache_miss = 0
+    _perf.debut = time.perf_counter()
+    _perf.profil = profile_target()
+    _perf.contexte = {}
+
+def set_run_context(version, filtres):
+    """Version des données et état des filtres du rerun (étiquettes des profils)"""
+    _perf.contexte = {'version': version, 'filtres': filtres}
+
+def _perf_active():
+    return getattr(_perf, 'mesures', None) is not None
+
+def note_cache_miss():
+    """Signale un calcul effectif : à placer dans le corps d'une fonction mise en cache,
+    qui ne s'exécute qu'en l'absence d'entrée"""
+    if _perf_active():
+        _perf.cache_miss += 1
+
+@contextmanager
+def perf_block(nom, entree=None, cache=False):
+    """Chronomètre un bloc nommé du rerun
+
+    `entree` : objet dont la longueur est notée (lignes en entrée) ; `cache` : le bloc
+    appelle une fonction en cache, dont on note hit/miss. Le dict produit reçoit les
+    champs complémentaires de l'appelant (lignes_sortie, payload_ko...).
+    """
+    mesure = {'bloc': nom}
+    cible = getattr(_perf, 'profil', '')
+    with profiled(nom) if cible and nom.split(' · ')[0] == cible else nullcontext():
+        if not _perf_active():
+            yield mesure
+            return
+        if entree is not None:
+            mesure['lignes_entree'] = len(entree)
+        miss_avant = _perf.cache_miss
+        debut = time.perf_counter()
+        try:
+            yield mesure
+        finally:
+            mesure['ms'] = round((time.perf_counter() - debut) * 1000, 1)
+            if cache:
+                mesure['cache'] = 'miss' if _perf.cache_miss > miss_avant else 'hit'
+            _perf.mesures.append(mesure)
+
+def profile_target():
+    """Cible du profilage : 'rerun', nom d'un bloc de perf_block, ou '' (désactivé)"""
+    return st.query_params.get('profil', PROFILE_CIBLE)
+
+# tracemalloc est global au processus : les profilages simultanés de plusieurs sessions
+# le partagent (compteur de références), le premier le démarre et le dernier l'arrête
+_traces = {'verrou': threading.Lock(), 'profilages': 0, 'externe': False}
+
+def _start_tracing():
+    with _traces['verrou']:
+        if _traces['profilages'] == 0:
+            _traces['externe'] = tracemalloc.is_tracing()
+            if not _traces['externe']:
+                tracemalloc.start()
+        _traces['profilages'] += 1
+        # Pic remis à zéro seulement sans autre profilage en cours (il leur est commun)
+        if _traces['profilages'] == 1:
+            tracemalloc.reset_peak()
+
+def _stop_tracing():
+    with _traces['verrou']:
+        _traces['profilages'] -= 1
+        if _traces['profilages'] == 0 and not _traces['externe']:
+            tracemalloc.stop()
+
+@contextmanager
+def profiled(cible, dossier=PROFILE_DIR):
+    """Exécute un bloc sous cProfile et tracemalloc, puis écrit le .prof et le rapport
+
+    tracemalloc est global au processus : les allocations des autres sessions actives
+    pendant la mesure sont comptées aussi, et le pic couvre tous les profilages en cours.
+    """
+    profil = cProfile.Profile()
+    _start_tracing()
+    debut = time.perf_counter()
+    profil.enable()
+    try:
+        yield
+    finally:
+        profil.disable()
+        duree = time.perf_counter() - debut
+        try:
+            cliche = tracemalloc.take_snapshot()
+            pic = tracemalloc.get_traced_memory()[1]
+        finally:
+            _stop_tracing()
+        write_profile_report(cible, profil, cliche, pic, duree, dossier)
+
+def write_profile_report(cible, profil, cliche, pic, duree, dossier=PROFILE_DIR):
+    """Écrit <base>.prof (pstats/snakeviz) et <base>.txt (allocations et fonctions les plus coûteuses)
+
+    Le nom de fichier porte la cible, l'empreinte des données et celle des filtres.
+    """
+    contexte = getattr(_perf, 'contexte', {})
+    version = contexte.get('version', get_dataset_version())
+    filtres = contexte.get('filtres')
+    empreinte_filtres = hashlib.sha1(repr(filtres).encode()).hexdigest()[:8]
+    base = os.path.join(dossier, "_".join([
+        datetime.now().strftime('%Y%m%d-%H%M%S'),
+        re.sub(r'\W+', '-', cible).strip('-'),
+        version,
+        empreinte_filtres
+    ]))
+
+    fonctions = io.StringIO()
+    pstats.Stats(profil, stream=fonctions).sort_stats('cumulative').print_stats(PROFILE_TOP_FONCTIONS)
+    allocations = cliche.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")
+    ]).statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]
+
+    try:
+        os.makedirs(dossier, exist_ok=True)
+        profil.dump_stats(base + '.prof')
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(f"Cible : {cible}\n")
+            f.write(f"Données : {version}\n")
+            f.write(f"Filtres : {filtres!r}\n")
+            f.write(f"Durée : {duree:.3f} s — pic mémoire tracé : {pic / 1e6:.1f} Mo\n\n")
+            f.write(f"Top {PROFILE_TOP_ALLOCATIONS} allocations (par ligne)\n")
+            for stat in allocations:
+                f.write(f"  {stat.size / 1024:>10.1f} Kio  {stat.count:>8}  {stat.traceback}\n")
+            f.write(f"\nTop {PROFILE_TOP_FONCTIONS} fonctions (temps cumulé)\n")
+            f.write(fonctions.getvalue())
+    except OSError:
+        pass
+
+def show_chart(fig, nom=None, **kwargs):
+    """st.plotly_chart chronométré, avec la taille JSON de la figure en mode debug"""
+    if not _perf_active():
+        return st.plotly_chart(fig, **kwargs)
+    titre = nom or fig.layout.title.text or kwargs.get('key') or 'figure'
+    payload_ko = round(len(fig.to_json()) / 1024, 1)
+    with perf_block(f"plotly_chart · {titre[:40]}") as mesure:
+        mesure['payload_ko'] = payload_ko
+        return st.plotly_chart(fig, **kwargs)
+
+def display_perf_panel(version, filtres, chemin=PERF_LOG_FILE):
+    """Panneau sidebar des mesures du rerun, ajoutées au journal (une ligne JSON par rerun)"""
+    if not _perf_active():
+        return
+    total_ms = round((time.perf_counter() - _perf.debut) * 1000, 1)
+    with st.sidebar.expander("⏱️ Performance (debug)", expanded=True):
+        st.metric("Rerun complet", f"{total_ms:,.0f} ms")
+        mesures = pd.DataFrame(_perf.mesures)
+        colonnes = ['bloc', 'ms', 'lignes_entree', 'lignes_sortie', 'cache', 'payload_ko', 'fichiers']
+        st.dataframe(mesures[[c for c in colonnes if c in mesures.columns]],
+                     use_container_width=True, hide_index=True)
+    try:
+        with open(chemin, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'ts': datetime.now().isoformat(timespec='seconds'),
+                                'version': version, 'filtres': filtres,
+                                'total_ms': total_ms, 'blocs': _perf.mesures},
+                               ensure_ascii=False, default=str) + '\n')
+    except OSError:
+        pass
+
+# ============================================================================
+# COUCHE DE REQUÊTES (PANDAS / DUCKDB)
+# ============================================================================
+
+SQL_FONCTIONS = {'count': 'count', 'sum': 'sum', 'mean': 'avg'}
+
+def _normalize_aggregations(agregations):
+    """{sortie: fonction} ou {sortie: (colonne, fonction)} -> {sortie: (colonne, fonction)}"""
+    return {sortie: (spec if isinstance(spec, tuple) else (sortie, spec))
+            for sortie, spec in agregations.items()}
+
+def use_duckdb(df):
+    """Le moteur DuckDB est-il demandé, disponible et applicable à ce DataFrame ?"""
+    return (QUERY_BACKEND == 'duckdb' and 'filtres' in df.attrs
+            and os.path.exists(PARQUET_FILE) and get_duckdb_connection() is not None)
+
+@st.cache_resource(show_spinner=False)
+def get_duckdb_connection():
+    """Connexion DuckDB en mémoire partagée (un curseur par requête), None si DuckDB est absent
+
+    Import différé : avec le moteur pandas par défaut, duckdb n'est jamais chargé.
+    """
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb.connect()
+
+def _sql_filters(filtres):
+    """Clause WHERE équivalente à load_data (emprise GPS) + apply_filters"""
+    dates, gravite_options, departements = filtres
+    conditions = [
+        f"(TRY_CAST(lat AS DOUBLE) BETWEEN {FRANCE_LAT[0]} AND {FRANCE_LAT[1]} OR lat IS NULL)",
+        f"(TRY_CAST(long AS DOUBLE) BETWEEN {FRANCE_LONG[0]} AND {FRANCE_LONG[1]} OR long IS NULL)"
+    ]
+    parametres = []
+    if len(dates) == 2:
+        conditions.append('TRY_CAST("date" AS TIMESTAMP) BETWEEN CAST(? AS TIMESTAMP) AND CAST(? AS TIMESTAMP)')
+        parametres.extend(dates)
+    if departements:
+        # Même normalisation que normalize_department_codes ('1' / 1.0 -> '01')
+        code = "regexp_replace(trim(CAST(dep AS VARCHAR)), '\\.0$', '')"
+        conditions.append(f"(CASE WHEN length({code}) = 1 THEN '0' || {code} ELSE {code} END) "
+                          f"IN ({', '.join('?' for _ in departements)})")
+        parametres.extend(departements)
+    if len(gravite_options) != 4:
+        if 'Mortels' not in gravite_options:
+            conditions.append('accident_mortel = 0')
+        if 'Blessés graves' not in gravite_options:
+            conditions.append('nb_blesses_hospitalises = 0')
+        if 'Blessés légers' not in gravite_options:
+            conditions.append('nb_blesses_legers = 0')
+    return conditions, parametres
+
+def _duckdb_group_stats(filtres, cles, agregations, poids=None):
+    """Agrégation groupée exécutée par DuckDB directement sur le fichier Parquet
+
+    Avec `poids`, score_gravite est recalculé dans la requête à partir des comptes
+    de victimes au lieu d'être lu dans le fichier.
+    """
+    sources = {colonne: f'"{colonne}"' for colonne, _ in agregations.values()}
+    if poids is not None and 'score_gravite' in sources:
+        sources['score_gravite'] = '(' + ' + '.join(
+            f'{p} * coalesce(CAST("{c}" AS DOUBLE), 0)' for c, p in zip(COLONNES_VICTIMES, poids)
+        ) + ')'
+    colonnes = ', '.join(f'"{c}"' for c in cles)
+    mesures = ', '.join(
+        f'{SQL_FONCTIONS[fonction]}(CAST({sources[colonne]} AS DOUBLE)) AS "{sortie}"' if fonction != 'count'
+        else f'count({sources[colonne]}) AS "{sortie}"'
+        for sortie, (colonne, fonction) in agregations.items()
+    )
+    conditions, parametres = _sql_filters(filtres)
+    conditions += [f'"{c}" IS NOT NULL' for c in cles]
     
-    # Agrégation quotidienne
-    daily = df.groupby('date').agg({
+    requete = (f"SELECT {colonnes}, {mesures} FROM read_parquet(?) "
+               f"WHERE {' AND '.join(conditions)} GROUP BY {colonnes} ORDER BY {colonnes}")
+    resultat = get_duckdb_connection().cursor().execute(requete, [PARQUET_FILE] + parametres).df()
+    
+    if 'date' in cles:
+        resultat['date'] = pd.to_datetime(resultat['date']).astype('datetime64[ns]')
+    return resultat
+
+def query_group_stats(df, by, agregations):
+    """Agrégation groupée de la couche de requêtes
+
+    Même résultat que `df.groupby(by).agg(...).reset_index()` quel que soit le moteur :
+    pandas sur le DataFrame filtré, ou DuckDB sur le Parquet avec les filtres de
+    `df.attrs['filtres']` poussés dans la requête.
+    """
+    cles = [by] if isinstance(by, str) else list(by)
+    agregations = _normalize_aggregations(agregations)
+    
+    if use_duckdb(df):
+        bareme = df.attrs.get('bareme')
+        return _duckdb_group_stats(df.attrs['filtres'], cles, agregations, bareme[0] if bareme else None)
+    
+    return df.groupby(cles, observed=True).agg(**agregations).reset_index()
+
+# ============================================================================
+# RENDU PROGRESSIF (ÉCHANTILLON STRATIFIÉ + CHARGEMENT EN ARRIÈRE-PLAN)
+# ============================================================================
+
+def is_derived_file_fresh(chemin=ECHANTILLON_FILE, source=DATA_FILE):
+    """Le fichier dérivé (échantillon, Arrow) est-il plus récent que le fichier consolidé ?"""
+    try:
+        return os.stat(chemin).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except OSError:
+        return False
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_sample_tier(version):
+    """Échantillon stratifié pour une version du fichier d'échantillon, None s'il est inutilisable
+
+    Présence et fraîcheur se vérifient avant l'appel (is_derived_file_fresh) : un
+    fichier absent n'est jamais mis en cache, et un nouvel échantillon change la version.
+    """
+    echantillon = load_data(ECHANTILLON_FILE)
+    if echantillon.empty or 'poids' not in echantillon.columns:
+        return None
+    return echantillon
+
+@st.cache_resource(show_spinner=False)
+def get_background_executor():
+    """Pool de threads partagé par toutes les sessions pour les calculs longs"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix='accidents')
+
+def write_arrow_dataset(df, chemin=ARROW_FILE):
+    """Écrit le DataFrame préparé en Arrow IPC non compressé, remplacé atomiquement"""
+    colonnes = {}
+    for nom in df.columns:
+        serie = df[nom]
+        if pd.api.types.is_float_dtype(serie):
+            # NaN gardés comme valeurs (pas de bitmap de validité) : relecture sans copie
+            colonnes[nom] = pa.array(serie.to_numpy(), from_pandas=False)
+        else:
+            colonnes[nom] = pa.Array.from_pandas(serie)
+    table = pa.table(colonnes)
+    
+    # Métadonnées pandas (catégories, types) reprises d'une conversion standard
+    table = table.replace_schema_metadata(
+        pa.Schema.from_pandas(df, preserve_index=False).metadata
+    )
+    
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    with pa.OSFile(temporaire, 'wb') as sortie:
+        with pa.ipc.new_file(sortie, table.schema) as ecriture:
+            ecriture.write_table(table)
+    os.replace(temporaire, chemin)
+
+def open_arrow_dataset(chemin=ARROW_FILE):
+    """Ouvre le dataset Arrow par memory-map
+
+    Les colonnes numériques sans valeurs nulles deviennent des vues numpy sur les pages
+    mappées (aucune copie) ; seuls les booléens, catégories et textes sont matérialisés.
+    """
+    table = pa.ipc.open_file(pa.memory_map(chemin, 'r')).read_all()
+    return table.to_pandas(split_blocks=True)
+
+def _load_full_data():
+    """Chargement complet (memory-map Arrow si à jour, sinon CSV) ; régénère les dérivés périmés"""
+    if pa is not None and is_derived_file_fresh(ARROW_FILE):
+        try:
+            return open_arrow_dataset()
+        except (OSError, pa.ArrowException):
+            pass
+    
+    df = load_data()
+    if df.empty:
+        return df
+    
+    if pa is not None and not is_derived_file_fresh(ARROW_FILE):
+        try:
+            write_arrow_dataset(df)
+        except (OSError, pa.ArrowException):
+            pass
+    
+    if not is_derived_file_fresh():
+        # Remplacement atomique : une autre session ne lit jamais un échantillon à moitié écrit
+        temporaire = f"{ECHANTILLON_FILE}.{os.getpid()}.tmp"
+        try:
+            build_stratified_sample(df).to_csv(temporaire, index=False, encoding='utf-8')
+            os.replace(temporaire, ECHANTILLON_FILE)
+        except OSError:
+            pass
+    return df
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_full_data_job(version):
+    """Chargement complet lancé une seule fois par version des données (Future partagée)"""
+    return get_background_executor().submit(_load_full_data)
+
+def log_filter_state(filtres, chemin=USAGE_LOG_FILE):
+    """Ajoute un état de filtres au journal d'usage (une ligne JSON par changement)"""
+    try:
+        with open(chemin, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'ts': datetime.now().isoformat(timespec='seconds'),
+                                'filtres': filtres}, ensure_ascii=False) + '\n')
+    except OSError:
+        pass
+
+def recent_filter_states(n=WARMER_ETATS_RECENTS, chemin=USAGE_LOG_FILE):
+    """Derniers états de filtres distincts du journal, du plus récent au plus ancien"""
+    try:
+        with open(chemin, encoding='utf-8') as f:
+            lignes = f.readlines()[-1000:]
+    except OSError:
+        return []
+    
+    etats = []
+    for ligne in reversed(lignes):
+        try:
+            dates, options, *departements = json.loads(ligne)['filtres']
+        except (ValueError, KeyError, TypeError):
+            continue
+        etat = (tuple(dates), tuple(options), tuple(departements[0]) if departements else ())
+        if etat not in etats:
+            etats.append(etat)
+        if len(etats) == n:
+            break
+    return etats
+
+def warm_filter_state(df, version, date_range, gravite_options, departements=()):
+    """Calcule pour un état de filtres les agrégats et les cartes par défaut du tableau de bord
+
+    Les clés sont celles de main() : une session qui arrive ensuite lit le cache.
+    """
+    df_filtered = apply_filters(df, date_range, gravite_options, departements)
+    filtres = make_filter_state(date_range, gravite_options, departements)
+    
+    get_temporal_cube((version, filtres, BAREME_DEFAUT), df_filtered)
+    get_hour_weekday_matrix((version, filtres, BAREME_DEFAUT), df_filtered)
+    get_geo_hierarchy((version, filtres, BAREME_DEFAUT), df_filtered)
+    
+    params_map = (('mode', 'grille'),)
+    render_map_html(make_map_key('heatmap', version, filtres, params_map),
+                    create_france_map, df_filtered, params_map)
+    params_hotspots = (('rayon_m', HOTSPOT_RAYON_M), ('min_accidents', HOTSPOT_MIN_ACCIDENTS),
+                       ('top_n', HOTSPOT_TOP_DEFAUT), ('seuils', BAREME_DEFAUT[1]))
+    render_map_html(make_map_key('hotspots', version, filtres, params_hotspots),
+                    create_accident_concentration_analysis, df_filtered, params_hotspots)
+
+def warm_caches(version):
+    """Préchauffe la vue par défaut puis les états de filtres les plus récents du journal"""
+    df = get_full_data_job(version).result()
+    if df.empty or 'date' not in df.columns or df['date'].isna().all():
+        return 0
+    
+    vue_defaut = ((df['date'].min().date(), df['date'].max().date()), GRAVITE_OPTIONS, ())
+    etats = [vue_defaut]
+    for dates, options, departements in recent_filter_states():
+        try:
+            date_range = tuple(pd.Timestamp(d).date() for d in dates) or None
+        except ValueError:
+            continue
+        if make_filter_state(date_range, options, departements) != make_filter_state(*vue_defaut):
+            etats.append((date_range, list(options), list(departements)))
+    
+    prechauffes = 0
+    for date_range, gravite_options, departements in etats:
+        try:
+            warm_filter_state(df, version, date_range, gravite_options, departements)
+            prechauffes += 1
+        except Exception:
+            # Le préchauffage est une optimisation : une erreur ne doit rien bloquer
+            continue
+    return prechauffes
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def start_cache_warmer(version):
+    """Lance le préchauffage une seule fois par version des données"""
+    return get_background_executor().submit(warm_caches, version)
+
+def weighted_mean_ci(valeurs, poids, z=1.96):
+    """Moyenne pondérée et demi-largeur de son intervalle de confiance à 95 %"""
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    poids = np.asarray(poids, dtype=np.float64)
+    total = poids.sum()
+    if total <= 0:
+        return np.nan, np.nan
+    moyenne = np.dot(poids, valeurs) / total
+    variance = np.sum((poids * (valeurs - moyenne)) ** 2) / total ** 2
+    return moyenne, z * np.sqrt(variance)
+
+def weighted_group_estimates(df_sample, cle, nom):
+    """Accidents estimés et taux de mortalité (± IC 95 %) par modalité de l'échantillon pondéré"""
+    lignes = []
+    for modalite, groupe in df_sample.groupby(cle, observed=True):
+        t, ic = weighted_mean_ci(groupe['accident_mortel'].to_numpy(dtype=np.float64), groupe['poids'])
+        lignes.append((modalite, groupe['poids'].sum(), t * 100, ic * 100))
+    return pd.DataFrame(lignes, columns=[nom, 'Accidents', 'Taux', 'IC'])
+
+def create_preview_rate_chart(stats, x, titre, height=400):
+    """Volume estimé (barres) et taux de mortalité avec barres d'erreur (axe secondaire)"""
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(go.Bar(x=stats[x], y=stats['Accidents'], name="Accidents (estimés)",
+                         marker_color='#3498db', opacity=0.6), secondary_y=False)
+    fig.add_trace(go.Scatter(x=stats[x], y=stats['Taux'], name="Taux de mortalité (%)",
+                             mode='lines+markers', line=dict(color='#e74c3c'),
+                             error_y=dict(type='data', array=stats['IC'], visible=True)),
+                  secondary_y=True)
+    fig.update_layout(title=titre, height=height, template='plotly_white', hovermode='x unified')
+    fig.update_yaxes(title_text="Accidents", secondary_y=False)
+    fig.update_yaxes(title_text="Taux de mortalité (%)", secondary_y=True)
+    return fig
+
+def display_sample_preview(df_sample):
+    """Aperçu immédiat calculé sur l'échantillon pondéré
+
+    KPI de la vue d'ensemble, puis les graphiques temporels, départementaux, de
+    conditions et de circonstances, chacun en volume estimé et taux de mortalité ± IC 95 %.
+    """
+    poids = df_sample['poids'].to_numpy(dtype=np.float64)
+    mortel = df_sample['accident_mortel'].to_numpy(dtype=np.float64)
+    # Accidents mortels tous présents (poids 1) sauf s'ils dépassaient leur part du budget
+    mortels_complets = bool(np.all(poids[mortel > 0] == 1))
+    
+    st.info(f"⏳ Aperçu approximatif calculé sur un échantillon stratifié de {len(df_sample):,} accidents "
+            f"({'tous les accidents mortels inclus' if mortels_complets else 'accidents mortels surreprésentés puis repondérés'})"
+            " — les résultats exacts s'affichent dès la fin du calcul complet.")
+    
+    if df_sample.empty:
+        return
+    
+    score = df_sample['score_gravite'].fillna(0).to_numpy(dtype=np.float64)
+    blesses = (df_sample['nb_blesses_hospitalises'].fillna(0).to_numpy(dtype=np.float64) +
+               df_sample['nb_blesses_legers'].fillna(0).to_numpy(dtype=np.float64))
+    
+    taux, ic_taux = weighted_mean_ci(mortel, poids)
+    gravite, ic_gravite = weighted_mean_ci(score, poids)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🚨 Accidents totaux", f"≈ {poids.sum():,.0f}")
+    with col2:
+        if mortels_complets:
+            st.metric("💔 Vies perdues", f"{int(df_sample['nb_tues'].sum()):,}")
+        else:
+            st.metric("💔 Vies perdues", f"≈ {np.dot(poids, df_sample['nb_tues'].fillna(0)):,.0f}")
+    with col3:
+        st.metric("🏥 Blessés totaux", f"≈ {np.dot(poids, blesses):,.0f}")
+    with col4:
+        st.metric("⚠️ Score gravité moyen", f"{gravite:.1f} ± {ic_gravite:.1f}")
+    
+    st.caption(f"Taux d'accidents mortels : {taux * 100:.2f} % ± {ic_taux * 100:.2f} (IC 95 %)")
+    
+    # Quand ? Évolution mensuelle, jours de la semaine et heures
+    if 'date' in df_sample.columns:
+        mois = df_sample['date'].dt.to_period('M').dt.to_timestamp()
+        st.plotly_chart(create_preview_rate_chart(weighted_group_estimates(df_sample, mois, 'Mois'),
+                                                  'Mois', "📈 Évolution mensuelle (aperçu)"),
+                        use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    if 'jour_semaine' in df_sample.columns:
+        jours = weighted_group_estimates(df_sample, 'jour_semaine', 'Jour')
+        jours['Jour'] = jours['Jour'].astype(int).map(dict(enumerate(
+            ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche'])))
+        with col1:
+            st.plotly_chart(create_preview_rate_chart(jours, 'Jour', "📅 Jours de la semaine (aperçu)"),
+                            use_container_width=True)
+    if 'heure' in df_sample.columns:
+        heures = weighted_group_estimates(df_sample[df_sample['heure'].between(0, 23)], 'heure', 'Heure')
+        with col2:
+            st.plotly_chart(create_preview_rate_chart(heures, 'Heure', "🕐 Heures de la journée (aperçu)"),
+                            use_container_width=True)
+    
+    # Où ? Départements les plus accidentogènes
+    if 'dep' in df_sample.columns:
+        departements = weighted_group_estimates(df_sample, 'dep', 'Département')
+        departements = departements.nlargest(15, 'Accidents')
+        departements['Département'] = departements['Département'].astype(str)
+        st.plotly_chart(create_preview_rate_chart(departements, 'Département',
+                                                  "🗺️ Top 15 des départements (aperçu)"),
+                        use_container_width=True)
+    
+    # Dans quelles conditions ? Météo, luminosité et type de collision
+    col1, col2 = st.columns(2)
+    for colonne, titre, conteneur in [('atm_desc', "🌦️ Conditions météo (aperçu)", col1),
+                                      ('lum_desc', "💡 Luminosité (aperçu)", col2),
+                                      ('col_desc', "💥 Types de collision (aperçu)", st.container())]:
+        if colonne in df_sample.columns:
+            stats = weighted_group_estimates(df_sample, colonne, 'Modalité').sort_values('Accidents', ascending=False)
+            with conteneur:
+                st.plotly_chart(create_preview_rate_chart(stats, 'Modalité', titre), use_container_width=True)
+
+def build_temporal_cube(df):
+    """Table de base quotidienne (un seul passage sur les données) pour tous les graphiques temporels
+
+    Contient les sommes par jour et les clés calendaires (mois, saison, jour de la
+    semaine, weekend) ; les vues mensuelle, saisonnière, hebdomadaire et weekend
+    en sont déduites par rollup_temporal.
+    """
+    if df.empty or 'date' not in df.columns or df['date'].isna().all():
+        return pd.DataFrame()
+    
+    daily = query_group_stats(df, 'date', {
         'Num_Acc': 'count',
         'nb_tues': 'sum',
         'nb_blesses_hospitalises': 'sum',
-        'score_gravite': 'mean'
+        'nb_mortels': ('accident_mortel', 'sum'),
+        'score_somme': ('score_gravite', 'sum'),
+        'score_n': ('score_gravite', 'count')
+    })
+    
+    # Clés calendaires calculées sur la petite table quotidienne
+    daily['mois'] = daily['date'].dt.month
+    daily['saison'] = daily['mois'].map(SAISONS)
+    daily['jour_semaine'] = daily['date'].dt.dayofweek
+    daily['est_weekend'] = (daily['jour_semaine'] >= 5).astype(int)
+    
+    return daily
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_temporal_cube(cache_key, _df):
+    """Table quotidienne mise en cache par (version des données, état des filtres, barème)"""
+    note_cache_miss()
+    return build_temporal_cube(_df)
+
+def rollup_temporal(cube, by):
+    """Agrège la table quotidienne selon une clé calendaire ('mois', 'saison', ...)"""
+    stats = cube.groupby(by).agg({
+        'Num_Acc': 'sum',
+        'nb_tues': 'sum',
+        'nb_blesses_hospitalises': 'sum',
+        'nb_mortels': 'sum',
+        'score_somme': 'sum',
+        'score_n': 'sum'
     }).reset_index()
-    daily.columns = ['Date', 'Accidents', 'Décès', 'Blessés graves', 'Gravité moyenne']
+    
+    # Moyennes reconstituées à partir des sommes
+    stats['accident_mortel'] = stats['nb_mortels'] / stats['Num_Acc']
+    stats['score_gravite'] = stats['score_somme'] / stats['score_n']
+    return stats
+
+def choose_time_bucket(dates):
+    """Choisit la granularité de la série temporelle selon l'étendue de la période"""
+    etendue = (dates.max() - dates.min()).days if len(dates) > 0 else 0
+    if etendue <= TIMESERIES_MAX_JOURS:
+        return 'D'
+    if etendue <= TIMESERIES_MAX_SEMAINES * 7:
+        return 'W-MON'
+    return 'MS'
+
+def resample_temporal_cube(cube, freq):
+    """Regroupe la table quotidienne par jour, semaine ou mois (sommes uniquement)"""
+    colonnes = ['Num_Acc', 'nb_tues', 'nb_blesses_hospitalises', 'score_somme', 'score_n']
+    if freq == 'D':
+        return cube[['date'] + colonnes]
+    return (cube.set_index('date')[colonnes]
+            .resample(freq, label='left', closed='left').sum()
+            .reset_index())
+
+def lttb_indices(x, y, n_out):
+    """Indices retenus par Largest-Triangle-Three-Buckets (forme de la courbe préservée)"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    
+    # Points intérieurs répartis en n_out - 2 paquets ; premier et dernier points conservés
+    bornes = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    
+    a = 0
+    for i in range(n_out - 2):
+        debut, fin = bornes[i], bornes[i + 1]
+        suivant_debut = fin
+        suivant_fin = bornes[i + 2] if i + 2 < len(bornes) else n
+        moy_x = x[suivant_debut:suivant_fin].mean()
+        moy_y = y[suivant_debut:suivant_fin].mean()
+        
+        # Aire du triangle (point retenu précédent, candidat, moyenne du paquet suivant)
+        aires = np.abs(
+            (x[a] - moy_x) * (y[debut:fin] - y[a]) -
+            (x[a] - x[debut:fin]) * (moy_y - y[a])
+        )
+        a = debut + int(np.argmax(aires))
+        indices[i + 1] = a
+    
+    return indices
+
+def create_time_series_chart(cube, downsample=True, max_points=TIMESERIES_MAX_POINTS, freq=None):
+    """Crée un graphique de série temporelle interactif
+
+    La granularité (jour 'D', semaine 'W-MON', mois 'MS') dépend de la période
+    sélectionnée si `freq` n'est pas imposée ; les courbes sont sous-échantillonnées
+    par LTTB à `max_points` points, et passent en rendu WebGL si le nombre de
+    points reste élevé.
+    """
+    from plotly.subplots import make_subplots
+
+    if cube.empty:
+        return go.Figure()
+    
+    freq = freq or choose_time_bucket(cube['date'])
+    serie = resample_temporal_cube(cube, freq)
+    libelle = {'D': 'quotidienne', 'W-MON': 'hebdomadaire', 'MS': 'mensuelle'}[freq]
+    
+    daily = pd.DataFrame({
+        'Date': serie['date'],
+        'Accidents': serie['Num_Acc'],
+        'Décès': serie['nb_tues'],
+        'Blessés graves': serie['nb_blesses_hospitalises'],
+        'Gravité moyenne': serie['score_somme'] / serie['score_n'].where(serie['score_n'] > 0)
+    })
+    
+    # Sous-échantillonnage des courbes (les barres sont déjà agrégées par la granularité)
+    x_num = daily['Date'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    if downsample:
+        idx_deces = lttb_indices(x_num, daily['Décès'], max_points)
+        idx_gravite = lttb_indices(x_num, daily['Gravité moyenne'], max_points)
+    else:
+        idx_deces = idx_gravite = np.arange(len(daily))
+    deces = daily.iloc[idx_deces]
+    gravite = daily.iloc[idx_gravite]
+    
+    # WebGL au-delà du seuil de points
+    Trace = go.Scattergl if max(len(deces), len(gravite)) > TIMESERIES_WEBGL_SEUIL else go.Scatter
+    barres_webgl = len(daily) > TIMESERIES_WEBGL_SEUIL
     
     # Création du graphique avec subplots
     fig = make_subplots(
         rows=2, cols=1,
-        subplot_titles=("Évolution quotidienne des accidents et décès", 
+        subplot_titles=(f"Évolution {libelle} des accidents et décès", 
                        "Score de gravité moyen"),
         vertical_spacing=0.12,
         row_heights=[0.6, 0.4],
         specs=[[{"secondary_y": True}], [{"secondary_y": False}]]
     )
     
-    # Trace accidents (barres)
-    fig.add_trace(
-        go.Bar(
+    # Trace accidents (barres, ou aire WebGL si les barres sont trop nombreuses)
+    if barres_webgl:
+        trace_accidents = go.Scattergl(
+            x=daily['Date'],
+            y=daily['Accidents'],
+            mode='lines',
+            name='Accidents',
+            line=dict(color='rgba(52, 152, 219, 0.6)', width=1),
+            fill='tozeroy',
+            hovertemplate='%{y} accidents<extra></extra>'
+        )
+    else:
+        trace_accidents = go.Bar(
             x=daily['Date'],
             y=daily['Accidents'],
             name='Accidents',
             marker_color='rgba(52, 152, 219, 0.6)',
             hovertemplate='%{y} accidents<extra></extra>'
-        ),
-        row=1, col=1, secondary_y=False
-    )
+        )
+    fig.add_trace(trace_accidents, row=1, col=1, secondary_y=False)
     
     # Trace décès (ligne)
     fig.add_trace(
-        go.Scatter(
-            x=daily['Date'],
-            y=daily['Décès'],
-            mode='lines+markers',
+        Trace(
+            x=deces['Date'],
+            y=deces['Décès'],
+            mode='lines+markers' if len(deces) <= 400 else 'lines',
             name='Décès',
             line=dict(color='#e74c3c', width=3),
             marker=dict(size=6, color='#c0392b'),
@@ -295,9 +1426,9 @@ def create_time_series_chart(df):
     
     # Trace gravité moyenne
     fig.add_trace(
-        go.Scatter(
-            x=daily['Date'],
-            y=daily['Gravité moyenne'],
+        Trace(
+            x=gravite['Date'],
+            y=gravite['Gravité moyenne'],
             mode='lines',
             name='Gravité moyenne',
             line=dict(color='#9b59b6', width=2),
@@ -328,53 +1459,89 @@ def create_time_series_chart(df):
     
     return fig
 
-def create_heatmap_hour_day(df):
-    """Crée une heatmap heure/jour de la semaine"""
+def compute_hour_weekday_matrix(df):
+    """Matrices heure x jour de la semaine (24x7) et heure x jour x gravité (24x7x4)
+
+    Un seul binning vectorisé : bincount sur le code combiné (heure, jour, gravité).
+    Retourne None si les colonnes 'heure' / 'jour_semaine' sont absentes ou vides.
+    """
     if df.empty or 'heure' not in df.columns or 'jour_semaine' not in df.columns:
+        return None
+    
+    heure = pd.to_numeric(df['heure'], errors='coerce').to_numpy(dtype=np.float64)
+    jour = pd.to_numeric(df['jour_semaine'], errors='coerce').to_numpy(dtype=np.float64)
+    valides = np.isfinite(heure) & np.isfinite(jour) & (heure >= 0) & (heure < 24) & (jour >= 0) & (jour < 7)
+    
+    if not valides.any():
+        return None
+    
+    # Classe de gravité (les accidents sans victime comptent comme matériels)
+    if 'categorie_gravite' in df.columns:
+        gravite = pd.Categorical(df['categorie_gravite'], categories=CATEGORIES_GRAVITE).codes
+        gravite = np.where(gravite < 0, 0, gravite)
+    else:
+        gravite = np.zeros(len(df), dtype=np.int64)
+    score = (df['score_gravite'].fillna(0).to_numpy(dtype=np.float64) if 'score_gravite' in df.columns
+             else np.zeros(len(df)))
+    
+    n_gravite = len(CATEGORIES_GRAVITE)
+    cellule = heure[valides].astype(np.int64) * 7 + jour[valides].astype(np.int64)
+    code = cellule * n_gravite + gravite[valides]
+    
+    par_gravite = np.bincount(code, minlength=24 * 7 * n_gravite).reshape(24, 7, n_gravite)
+    score_somme = np.bincount(cellule, weights=score[valides], minlength=24 * 7).reshape(24, 7)
+    
+    return {
+        'nombre': par_gravite.sum(axis=2),
+        'score_somme': score_somme,
+        'par_gravite': par_gravite
+    }
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_hour_weekday_matrix(cache_key, _df):
+    """Matrices heure x jour mises en cache par (version des données, état des filtres, barème)"""
+    note_cache_miss()
+    return compute_hour_weekday_matrix(_df)
+
+def create_heatmap_hour_day(matrice, categorie=None):
+    """Crée une heatmap heure/jour de la semaine
+
+    Sans `categorie`, la couleur représente la gravité moyenne ; sinon le nombre
+    d'accidents de la catégorie de gravité choisie.
+    """
+    if matrice is None:
         st.warning("⚠️ Données temporelles manquantes pour la carte de chaleur")
         st.info("Colonnes nécessaires : 'heure' et 'jour_semaine'")
         return go.Figure()
     
-    # Filtrer les valeurs valides
-    df_valid = df.dropna(subset=['heure', 'jour_semaine'])
+    nombre = matrice['nombre']
     
-    if len(df_valid) == 0:
+    if nombre.sum() == 0:
         st.warning("⚠️ Aucune donnée valide pour créer la carte de chaleur")
         return go.Figure()
     
-    # Préparation des données
-    heatmap_data = df_valid.groupby(['heure', 'jour_semaine']).agg({
-        'score_gravite': 'mean',
-        'Num_Acc': 'count'
-    }).reset_index()
-    
-    # Pivot pour la heatmap
-    pivot_gravite = heatmap_data.pivot_table(
-        index='heure', 
-        columns='jour_semaine', 
-        values='score_gravite',
-        fill_value=0
-    )
-    
-    pivot_count = heatmap_data.pivot_table(
-        index='heure', 
-        columns='jour_semaine', 
-        values='Num_Acc',
-        fill_value=0
-    )
+    if categorie is None:
+        valeurs = np.divide(matrice['score_somme'], nombre,
+                            out=np.zeros(nombre.shape), where=nombre > 0)
+        titre_barre, format_z = "Score<br>gravité", "Gravité: %{z:.1f}<br>"
+        texte = nombre
+    else:
+        valeurs = matrice['par_gravite'][:, :, CATEGORIES_GRAVITE.index(categorie)]
+        titre_barre, format_z = "Accidents", f"{categorie}: %{{z}}<br>"
+        texte = valeurs
     
     # Création de la heatmap
     fig = go.Figure(data=go.Heatmap(
-        z=pivot_gravite.values,
+        z=valeurs,
         x=['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche'],
-        y=pivot_gravite.index,
+        y=list(range(24)),
         colorscale='RdYlGn_r',
-        colorbar=dict(title="Score<br>gravité"),
-        text=pivot_count.values,
+        colorbar=dict(title=titre_barre),
+        text=texte,
         texttemplate="%{text} accidents",
         textfont={"size": 8},
         hovertemplate="<b>%{x} %{y}h</b><br>" +
-                     "Gravité: %{z:.1f}<br>" +
+                     format_z +
                      "Accidents: %{text}<br>" +
                      "<extra></extra>"
     ))
@@ -389,89 +1556,742 @@ def create_heatmap_hour_day(df):
     
     return fig
 
-def create_france_map(df):
-    """Crée une carte de France avec les accidents"""
-    if df.empty:
+def aggregate_heatmap_grid(df, zoom=ZOOM_FRANCE, cell_px=HEATMAP_CELL_PX):
+    """Agrège les accidents géolocalisés sur une grille pondérée par la gravité
+
+    La taille des cellules correspond à `cell_px` pixels au niveau de zoom donné,
+    et le nombre de cellules est plafonné : le résultat (une ligne
+    [lat, long, intensité] par cellule non vide) ne dépend pas du nombre d'accidents.
+    """
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['long'].to_numpy(dtype=np.float64)
+    if 'score_gravite' in df.columns:
+        poids = df['score_gravite'].fillna(0).to_numpy(dtype=np.float64)
+    else:
+        poids = np.ones(len(df))
+
+    valides = (
+        np.isfinite(lat) & np.isfinite(lon) &
+        (lat >= FRANCE_LAT[0]) & (lat <= FRANCE_LAT[1]) &
+        (lon >= FRANCE_LONG[0]) & (lon <= FRANCE_LONG[1])
+    )
+    lat, lon, poids = lat[valides], lon[valides], poids[valides]
+
+    if len(lat) == 0:
+        return np.empty((0, 3))
+
+    # Pas de la grille en degrés (tuiles de 256 px), cellules ~carrées à la latitude de la France
+    pas_long = 360.0 / (256 * 2 ** zoom) * cell_px
+    pas_lat = pas_long * np.cos(np.radians(FRANCE_CENTRE[0]))
+    n_lat = int(np.ceil((FRANCE_LAT[1] - FRANCE_LAT[0]) / pas_lat)) + 1
+    n_long = int(np.ceil((FRANCE_LONG[1] - FRANCE_LONG[0]) / pas_long)) + 1
+
+    # Zoom élevé : on élargit les cellules pour borner le temps de calcul et la taille du résultat
+    if n_lat * n_long > HEATMAP_MAX_CELLS:
+        facteur = np.sqrt(n_lat * n_long / HEATMAP_MAX_CELLS)
+        pas_lat, pas_long = pas_lat * facteur, pas_long * facteur
+        n_lat = int(np.ceil((FRANCE_LAT[1] - FRANCE_LAT[0]) / pas_lat)) + 1
+        n_long = int(np.ceil((FRANCE_LONG[1] - FRANCE_LONG[0]) / pas_long)) + 1
+
+    i = ((lat - FRANCE_LAT[0]) / pas_lat).astype(np.int64)
+    j = ((lon - FRANCE_LONG[0]) / pas_long).astype(np.int64)
+    code = i * n_long + j
+
+    somme = np.bincount(code, weights=poids, minlength=n_lat * n_long)
+    nombre = np.bincount(code, minlength=n_lat * n_long)
+    cellules = np.flatnonzero(nombre)
+
+    # Centre des cellules non vides et intensité normalisée sur [0, 1]
+    lat_c = FRANCE_LAT[0] + (cellules // n_long + 0.5) * pas_lat
+    long_c = FRANCE_LONG[0] + (cellules % n_long + 0.5) * pas_long
+    intensite = somme[cellules]
+    if intensite.max() > 0:
+        intensite = intensite / intensite.max()
+
+    return np.column_stack([lat_c, long_c, intensite])
+
+def allocate_quotas(effectifs, budget):
+    """Répartit `budget` points entre strates proportionnellement à leurs effectifs
+
+    Plus forts restes pour l'arrondi ; chaque strate non vide reçoit au moins un point
+    tant que le budget le permet (zones rurales peu denses représentées).
+    """
+    effectifs = np.asarray(effectifs, dtype=np.int64)
+    if budget >= effectifs.sum():
+        return effectifs.copy()
+
+    plancher = np.zeros_like(effectifs)
+    if budget >= np.count_nonzero(effectifs):
+        plancher = (effectifs > 0).astype(np.int64)
+    reste = budget - plancher.sum()
+    poids = effectifs - plancher
+
+    part = reste * poids / max(poids.sum(), 1)
+    quotas = np.floor(part).astype(np.int64)
+    manque = int(reste - quotas.sum())
+    if manque > 0:
+        quotas[np.argsort(quotas - part, kind='stable')[:manque]] += 1
+    return np.minimum(plancher + quotas, effectifs)
+
+def stratified_map_sample(df, budget=POINTS_BUDGET, pas_deg=POINTS_STRATE_DEG,
+                          part_densite=POINTS_PART_DENSITE, graine=42):
+    """Échantillon spatialement stratifié des accidents pour la heatmap en points
+
+    Les accidents mortels, puis les accidents graves (blessés hospitalisés), sont tous
+    conservés tant qu'ils laissent `part_densite` du budget aux autres accidents ; au-delà
+    (périodes de plusieurs années), ils sont eux-mêmes échantillonnés, les mortels
+    restant tous visibles sur le calque de marqueurs. Chaque échantillonnage répartit son quota
+    entre cellules de `pas_deg` degrés au prorata de leur effectif (au moins un point
+    par cellule), avec tirage aléatoire dans chaque cellule, en une passe vectorisée.
+
+    Retourne (positions dans `df`, facteur d'extrapolation de chaque point) : le
+    facteur (effectif / quota de la cellule, 1 pour les points conservés d'office)
+    rend à la heatmap la densité de l'ensemble des accidents.
+    """
+    n = len(df)
+    if n <= budget:
+        return np.arange(n), np.ones(n)
+
+    rng = np.random.default_rng(graine)
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['long'].to_numpy(dtype=np.float64)
+    mortel = (df['accident_mortel'].to_numpy(dtype=bool) if 'accident_mortel' in df.columns
+              else np.zeros(n, dtype=bool))
+    grave = (df['nb_blesses_hospitalises'].fillna(0).to_numpy() > 0
+             if 'nb_blesses_hospitalises' in df.columns else np.zeros(n, dtype=bool)) & ~mortel
+
+    # Strates : cellules ~carrées (pas en longitude corrigé de la latitude moyenne)
+    pas_long = pas_deg / np.cos(np.radians(FRANCE_CENTRE[0]))
+    n_lat = int(np.ceil((FRANCE_LAT[1] - FRANCE_LAT[0]) / pas_deg)) + 1
+    n_long = int(np.ceil((FRANCE_LONG[1] - FRANCE_LONG[0]) / pas_long)) + 1
+    i = np.clip(((lat - FRANCE_LAT[0]) / pas_deg).astype(np.int64), 0, n_lat - 1)
+    j = np.clip(((lon - FRANCE_LONG[0]) / pas_long).astype(np.int64), 0, n_long - 1)
+    strate = i * n_long + j
+
+    # Plafond cumulé de chaque niveau : mortels et graves jusqu'à la part réservée à
+    # la densité, autres accidents jusqu'au budget. Un niveau sans quota est reporté
+    # sur le suivant : chaque accident reste représenté par un point pondéré.
+    plafond_graves = int(budget * (1 - part_densite))
+    plafonds = [plafond_graves, plafond_graves, budget]
+    positions, facteurs = [], []
+    gardes = 0
+    reportes = np.zeros(n, dtype=bool)
+    for masque, plafond in zip([mortel, grave, ~(mortel | grave)], plafonds):
+        masque = masque | reportes
+        quota = max(plafond - gardes, 0)
+        if quota == 0 and plafond < budget:
+            reportes = masque
+            continue
+        reportes = np.zeros(n, dtype=bool)
+        membres = np.flatnonzero(masque)
+        if len(membres) <= quota:
+            garde, facteur = membres, np.ones(len(membres))
+        else:
+            strate_m = strate[membres]
+            effectifs = np.bincount(strate_m, minlength=n_lat * n_long)
+            quotas = allocate_quotas(effectifs, quota)
+
+            # Rang aléatoire de chaque accident dans sa cellule (tri sur cellule + aléa)
+            ordre = np.argsort(strate_m + rng.random(len(membres)))
+            debut = np.cumsum(effectifs) - effectifs
+            rang = np.empty(len(membres), dtype=np.int64)
+            rang[ordre] = np.arange(len(membres)) - debut[strate_m[ordre]]
+
+            selection = rang < quotas[strate_m]
+            garde = membres[selection]
+            facteur = effectifs[strate_m[selection]] / quotas[strate_m[selection]]
+        positions.append(garde)
+        facteurs.append(facteur)
+        gardes += len(garde)
+
+    positions = np.concatenate(positions)
+    ordre = np.argsort(positions, kind='stable')
+    return positions[ordre], np.concatenate(facteurs)[ordre]
+
+def _mercator_y(lat):
+    """Ordonnée Web Mercator (en radians) d'une latitude en degrés"""
+    return np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+
+def kernel_weights(noyau, bande_px):
+    """Noyau 2D discret (somme 1) de bande passante `bande_px` pixels
+
+    'gaussien' (tronqué à 3 écarts-types), 'epanechnikov' (1 - r²) ou 'quartique'
+    ((1 - r²)², support borné), avec r = distance / bande passante.
+    """
+    bande_px = max(float(bande_px), 0.5)
+    rayon = max(1, int(np.ceil(3 * bande_px if noyau == 'gaussien' else bande_px)))
+    axe = np.arange(-rayon, rayon + 1) / bande_px
+    r2 = axe[:, None] ** 2 + axe[None, :] ** 2
+    if noyau == 'gaussien':
+        poids = np.exp(-0.5 * r2)
+    elif noyau == 'epanechnikov':
+        poids = np.clip(1 - r2, 0, None)
+    elif noyau == 'quartique':
+        poids = np.clip(1 - r2, 0, None) ** 2
+    else:
+        raise ValueError(f"Noyau inconnu : {noyau}")
+    if poids.sum() == 0:
+        poids[rayon, rayon] = 1
+    return poids / poids.sum()
+
+def fft_convolve(grille, noyau):
+    """Convolution 2D par FFT (taille de sortie = celle de la grille, bords à zéro)
+
+    Coût O(n log n) quel que soit le rayon du noyau, là où une KDE directe est
+    quadratique en nombre d'accidents.
+    """
+    h, w = grille.shape
+    kh, kw = noyau.shape
+    forme = (h + kh - 1, w + kw - 1)
+    spectre = np.fft.rfft2(grille, forme) * np.fft.rfft2(noyau, forme)
+    complet = np.fft.irfft2(spectre, forme)
+    haut, gauche = kh // 2, kw // 2
+    # Le bruit d'arrondi de la FFT donne de petites valeurs négatives
+    return np.clip(complet[haut:haut + h, gauche:gauche + w], 0, None)
+
+def bin_mercator_grid(df, largeur, ponderation='score_gravite'):
+    """Histogramme 2D pondéré des accidents sur une grille Web Mercator couvrant la France
+
+    La grille se superpose exactement aux tuiles ; `ponderation` est une colonne
+    (score_gravite, nb_tues...) ou None pour compter les accidents.
+    Retourne (grille [ligne 0 = nord], pas de la grille en radians).
+    """
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['long'].to_numpy(dtype=np.float64)
+    if ponderation is not None and ponderation in df.columns:
+        poids = df[ponderation].fillna(0).to_numpy(dtype=np.float64)
+    else:
+        poids = np.ones(len(df))
+
+    y_min, y_max = _mercator_y(FRANCE_LAT[0]), _mercator_y(FRANCE_LAT[1])
+    pas = np.radians(FRANCE_LONG[1] - FRANCE_LONG[0]) / largeur
+    hauteur = int(np.ceil((y_max - y_min) / pas))
+
+    valides = (
+        np.isfinite(lat) & np.isfinite(lon) &
+        (lat >= FRANCE_LAT[0]) & (lat < FRANCE_LAT[1]) &
+        (lon >= FRANCE_LONG[0]) & (lon < FRANCE_LONG[1])
+    )
+    colonne = ((np.radians(lon[valides] - FRANCE_LONG[0])) / pas).astype(np.int64)
+    ligne = ((y_max - _mercator_y(lat[valides])) / pas).astype(np.int64)
+    colonne = np.clip(colonne, 0, largeur - 1)
+    ligne = np.clip(ligne, 0, hauteur - 1)
+
+    grille = np.bincount(
+        ligne * largeur + colonne,
+        weights=poids[valides],
+        minlength=hauteur * largeur
+    ).reshape(hauteur, largeur)
+    return grille, pas
+
+def colorize_density(densite, gradient=HEATMAP_GRADIENT):
+    """Convertit une grille de densité normalisée [0, 1] en image RGBA (uint8)"""
+    couleurs_rgb = {
+        'blue': (0, 0, 255), 'yellow': (255, 255, 0),
+        'orange': (255, 165, 0), 'red': (255, 0, 0)
+    }
+    paliers = sorted(gradient.items())
+    positions = np.array([p for p, _ in paliers])
+    rgb = np.array([couleurs_rgb[c] for _, c in paliers], dtype=np.float64)
+
+    image = np.zeros(densite.shape + (4,), dtype=np.uint8)
+    for canal in range(3):
+        image[..., canal] = np.interp(densite, positions, rgb[:, canal]).astype(np.uint8)
+    # Transparence : les zones sans accident restent invisibles
+    image[..., 3] = (np.clip(densite * 4, 0, 1) * 200).astype(np.uint8)
+    return image
+
+def encode_png(image, niveau=6):
+    """Encode une image RGBA uint8 (ligne 0 = haut) en PNG
+
+    Même format que folium, mais avec une compression zlib 6 au lieu de 9 : fichier
+    quasi identique, encodage environ 8 fois plus rapide sur les grandes images.
+    """
+    hauteur, largeur = image.shape[:2]
+    brut = np.zeros((hauteur, largeur * 4 + 1), dtype=np.uint8)
+    brut[:, 1:] = image.reshape(hauteur, largeur * 4)
+
+    def bloc(balise, donnees):
+        entete = balise + donnees
+        return struct.pack('!I', len(donnees)) + entete + struct.pack('!I', zlib.crc32(entete) & 0xFFFFFFFF)
+
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        bloc(b'IHDR', struct.pack('!2I5B', largeur, hauteur, 8, 6, 0, 0, 0)),
+        bloc(b'IDAT', zlib.compress(brut.tobytes(), niveau)),
+        bloc(b'IEND', b'')
+    ])
+
+def png_data_url(image):
+    """URL data: d'une image RGBA, directement utilisable par ImageOverlay"""
+    return 'data:image/png;base64,' + base64.b64encode(encode_png(image)).decode('ascii')
+
+def compute_density_raster(df, largeur=RASTER_LARGEUR, sigma_px=RASTER_SIGMA_PX):
+    """Calcule l'image de densité des accidents (histogramme 2D lissé, pondéré par la gravité)
+
+    L'image est construite en projection Web Mercator pour se superposer exactement
+    aux tuiles ; sa taille est fixe quel que soit le nombre d'accidents.
+    Retourne l'image RGBA (ligne 0 = nord) et ses bornes [[lat_min, long_min], [lat_max, long_max]].
+    """
+    grille, _ = bin_mercator_grid(df, largeur)
+    grille = fft_convolve(grille, kernel_weights('gaussien', sigma_px))
+
+    # Normalisation robuste : le 99e centile des cellules non vides donne le rouge
+    positives = grille[grille > 0]
+    if len(positives) > 0:
+        grille = np.clip(grille / np.percentile(positives, 99), 0, 1)
+
+    bornes = [[FRANCE_LAT[0], FRANCE_LONG[0]], [FRANCE_LAT[1], FRANCE_LONG[1]]]
+    return colorize_density(grille), bornes
+
+def compute_kde_surface(df, ponderation='score_gravite', bande_m=KDE_BANDE_DEFAUT_M,
+                        noyau='gaussien', largeur=KDE_LARGEUR):
+    """Surface de risque lissée : estimation par noyau sur grille fine, convoluée par FFT
+
+    Les accidents sont agrégés sur la grille Web Mercator (pondérés par `ponderation`),
+    puis convolués avec le noyau choisi ; la bande passante en mètres est convertie en
+    pixels à la latitude centrale. La densité est exprimée par km² (surface réelle de
+    chaque ligne de la grille), donc comparable d'un filtre ou d'une pondération à l'autre.
+    """
+    grille, pas = bin_mercator_grid(df, largeur, ponderation)
+    rayon_terre = 6_371_000.0
+    cellule_m = pas * rayon_terre * np.cos(np.radians(FRANCE_CENTRE[0]))
+    densite = fft_convolve(grille, kernel_weights(noyau, bande_m / cellule_m))
+
+    # Surface au sol de chaque ligne (la maille Mercator rétrécit vers le nord)
+    y_max = _mercator_y(FRANCE_LAT[1])
+    y_lignes = y_max - (np.arange(grille.shape[0]) + 0.5) * pas
+    lat_lignes = np.degrees(2 * np.arctan(np.exp(y_lignes)) - np.pi / 2)
+    surface_km2 = (pas * rayon_terre / 1000) ** 2 * np.cos(np.radians(lat_lignes)) ** 2
+    densite = (densite / surface_km2[:, None]).astype(np.float32)
+
+    return {
+        'densite': densite,
+        'bornes': [[FRANCE_LAT[0], FRANCE_LONG[0]], [FRANCE_LAT[1], FRANCE_LONG[1]]],
+        'cellule_m': round(float(cellule_m)),
+        'ponderation': ponderation or 'accidents',
+        'bande_m': bande_m,
+        'noyau': noyau
+    }
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def get_kde_surface(cache_key, _df, ponderation, bande_m, noyau):
+    """Surface de risque mise en cache par (version des données, état des filtres, barème) et paramètres"""
+    note_cache_miss()
+    return compute_kde_surface(_df, ponderation, bande_m, noyau)
+
+def kde_image(surface):
+    """Image RGBA de la surface (99e centile des cellules non nulles = rouge)"""
+    densite = surface['densite']
+    positives = densite[densite > 0]
+    echelle = np.percentile(positives, 99) if len(positives) > 0 else 1.0
+    return colorize_density(np.clip(densite / echelle, 0, 1))
+
+def kde_png(surface):
+    """Export PNG de la surface (même projection que les tuiles, bornes dans `surface`)"""
+    return encode_png(kde_image(surface))
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def get_kde_exports(cache_key, ponderation, bande_m, noyau, _surface):
+    """Fichiers d'export de la surface (PNG, grille .npz), sous la même clé que la surface
+
+    Sans ce cache, l'encodage serait refait à chaque rerun et pas seulement au
+    téléchargement (les boutons reçoivent leurs données à l'affichage).
+    """
+    note_cache_miss()
+    tampon = io.BytesIO()
+    np.savez_compressed(tampon, densite=_surface['densite'], bornes=np.array(_surface['bornes']))
+    return kde_png(_surface), tampon.getvalue()
+
+def create_kde_map(surface):
+    """Carte de la surface de risque : une image superposée aux tuiles"""
+    import folium
+
+    m = folium.Map(
+        location=FRANCE_CENTRE,
+        zoom_start=ZOOM_FRANCE,
+        tiles='OpenStreetMap',
+        prefer_canvas=True
+    )
+    folium.raster_layers.ImageOverlay(
+        image=png_data_url(kde_image(surface)),
+        bounds=surface['bornes'],
+        origin='upper',
+        opacity=0.75,
+        name='Surface de risque'
+    ).add_to(m)
+    return m
+
+# Marqueur créé dans le navigateur pour chaque ligne [lat, long, décès, date] ;
+# le contenu du popup n'est construit qu'à l'ouverture
+FATAL_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 5, color: 'red', fill: true, fillColor: 'red', fillOpacity: 0.7
+    });
+    marker.bindPopup(function () {
+        return '<b>Accident mortel</b><br>Décès : ' + row[2] +
+               (row[3] ? '<br>Date : ' + row[3] : '');
+    });
+    return marker;
+}
+"""
+
+def add_fatal_accidents_layer(m, df_mortel):
+    """Ajoute tous les accidents mortels à la carte sous forme de clusters
+
+    Les coordonnées sont envoyées en un seul tableau compact ; les marqueurs et
+    leurs popups sont créés par le navigateur (Leaflet.markercluster).
+    """
+    from folium.plugins import FastMarkerCluster
+
+    if len(df_mortel) == 0:
+        return m
+
+    deces = (df_mortel['nb_tues'].fillna(0).astype(int) if 'nb_tues' in df_mortel.columns
+             else pd.Series(0, index=df_mortel.index))
+    dates = (df_mortel['date'].dt.strftime('%d/%m/%Y').fillna('') if 'date' in df_mortel.columns
+             else pd.Series('', index=df_mortel.index))
+
+    donnees = list(zip(
+        df_mortel['lat'].astype(np.float64).round(5).tolist(),
+        df_mortel['long'].astype(np.float64).round(5).tolist(),
+        deces.tolist(),
+        dates.tolist()
+    ))
+
+    FastMarkerCluster(
+        donnees,
+        callback=FATAL_MARKER_CALLBACK,
+        name='Accidents mortels',
+        options={'maxClusterRadius': 40, 'disableClusteringAtZoom': 13}
+    ).add_to(m)
+    return m
+
+# Bascule des couches de la grille au zoom : seule la couche de la bande courante est affichée
+HEATMAP_BASCULE_JS = """
+{% macro script(this, kwargs) %}
+(function () {
+    var carte = {{ this._parent.get_name() }};
+    var couches = [{% for zoom, couche in this.couches %}[{{ zoom }}, {{ couche }}]{{ "," if not loop.last }}{% endfor %}];
+    function basculer() {
+        var active = couches[0][1];
+        couches.forEach(function (c) { if (carte.getZoom() >= c[0]) { active = c[1]; } });
+        couches.forEach(function (c) {
+            if (c[1] === active) { if (!carte.hasLayer(c[1])) { carte.addLayer(c[1]); } }
+            else if (carte.hasLayer(c[1])) { carte.removeLayer(c[1]); }
+        });
+    }
+    carte.on('zoomend', basculer);
+    basculer();
+})();
+{% endmacro %}
+"""
+
+def add_zoom_band_switch(m, couches):
+    """Ajoute à la carte le script qui n'affiche que la couche de la bande de zoom courante
+
+    `couches` : liste de (zoom minimal de la bande, couche folium), par zoom croissant.
+    """
+    from branca.element import MacroElement
+    from jinja2 import Template
+
+    bascule = MacroElement()
+    bascule._template = Template(HEATMAP_BASCULE_JS)
+    bascule.couches = [(zoom, couche.get_name()) for zoom, couche in couches]
+    bascule.add_to(m)
+
+def create_france_map(df, mode='grille', zoom=ZOOM_FRANCE):
+    """Crée une carte de France avec les accidents
+
+    mode='grille' agrège tous les accidents sur une grille pondérée, une couche par
+    bande de HEATMAP_BANDES_ZOOM basculée au zoom côté navigateur ; mode='raster'
+    superpose une image de densité lissée et mode='points' affiche un échantillon
+    spatialement stratifié de POINTS_BUDGET accidents.
+    """
+    import folium
+
+    if df.empty:
+        return None
+
+    if 'lat' not in df.columns or 'long' not in df.columns:
+        return None
+
+    # Filtrer les données avec coordonnées valides
+    df_map = df.dropna(subset=['lat', 'long'])
+
+    if len(df_map) == 0:
+        return None
+
+    try:
+        # Créer la carte centrée sur la France
+        m = folium.Map(
+            location=FRANCE_CENTRE,
+            zoom_start=zoom,
+            tiles='OpenStreetMap',
+            prefer_canvas=True  # AJOUTER CETTE LIGNE
+        )
+
+        # Ajouter une heatmap
+        from folium.plugins import HeatMap
+
+        if mode == 'raster':
+            # Une seule image de densité, quelle que soit la taille des données
+            image, bornes = compute_density_raster(df_map)
+            folium.raster_layers.ImageOverlay(
+                image=png_data_url(image),
+                bounds=bornes,
+                origin='upper',
+                opacity=0.8,
+                name='Densité des accidents'
+            ).add_to(m)
+        elif mode == 'grille':
+            # Une grille par bande de zoom (une entrée par cellule non vide, rayon calé
+            # sur la taille des cellules) : la carte mise en cache suit le zoom sans rerun
+            couches = []
+            for zoom_bande in HEATMAP_BANDES_ZOOM:
+                grille = aggregate_heatmap_grid(df_map, zoom=zoom_bande)
+                couche = HeatMap(
+                    grille.round(3).tolist(),
+                    min_opacity=0.2,
+                    max_zoom=18,
+                    radius=int(HEATMAP_CELL_PX * 1.5),
+                    blur=HEATMAP_CELL_PX,
+                    gradient=HEATMAP_GRADIENT,
+                    name=f'Densité (zoom {zoom_bande}+)'
+                ).add_to(m)
+                couches.append((zoom_bande, couche))
+            add_zoom_band_switch(m, couches)
+        else:
+            # Échantillon stratifié (budget fixe), pondéré pour restituer la densité réelle
+            positions, facteurs = stratified_map_sample(df_map)
+            df_sample = df_map.iloc[positions]
+
+            # Préparer les données pour la heatmap (intensité normalisée sur [0, 1])
+            poids = (df_sample['score_gravite'].fillna(0).to_numpy(dtype=np.float64)
+                     if 'score_gravite' in df_sample.columns else np.ones(len(df_sample)))
+            intensite = poids * facteurs
+            if intensite.max() > 0:
+                intensite = intensite / intensite.max()
+            heat_data = np.column_stack([
+                df_sample['lat'].to_numpy(dtype=np.float64).round(5),
+                df_sample['long'].to_numpy(dtype=np.float64).round(5),
+                intensite.round(3)
+            ]).tolist()
+            HeatMap(
+                heat_data,
+                min_opacity=0.2,
+                max_zoom=18,
+                radius=15,
+                blur=15,
+                gradient=HEATMAP_GRADIENT
+            ).add_to(m)
+        
+        # Ajouter tous les accidents mortels, regroupés côté navigateur
+        if 'accident_mortel' in df_map.columns:
+            add_fatal_accidents_layer(m, df_map[df_map['accident_mortel'] == 1])
+        
+        return m
+    
+    except Exception as e:
+        st.error(f"Erreur création carte: {e}")
+        return None
+
+def normalize_department_codes(serie):
+    """Codes département au format INSEE ('1' -> '01', '2A' et '971' inchangés)"""
+    codes = _format_code_geo(serie)
+    return codes.where(~codes.str.fullmatch(r'\d'), codes.str.zfill(2))
+
+def normalize_commune_codes(serie):
+    """Codes commune INSEE sur 5 caractères ('1033' -> '01033', '2A004' inchangé)"""
+    codes = _format_code_geo(serie)
+    return codes.where(~codes.str.fullmatch(r'\d{1,4}'), codes.str.zfill(5))
+
+def _finalize_geo_measures(table):
+    """Mesures dérivées d'un niveau géographique à partir des sommes de base"""
+    table['Gravité moyenne'] = np.where(table['score_n'] > 0, table['score_somme'] / table['score_n'].clip(lower=1), np.nan)
+    table['Taux de mortalité'] = table['Décès'] / table['Accidents'] * 100  # décès pour 100 accidents
+    return table.drop(columns=['score_somme', 'score_n'])
+
+def compute_geo_hierarchy(df):
+    """Agrégats commune -> département -> région
+
+    Les mesures de base (sommes) sont calculées une seule fois par commune puis
+    remontées aux départements et aux régions via REGIONS_DEPARTEMENTS. Les tranches
+    de chaque niveau sont indexées par le code du parent pour le drill-down.
+    """
+    if df.empty or 'dep' not in df.columns:
+        return None
+    
+    cles = ['dep', 'com'] if 'com' in df.columns else ['dep']
+    communes = query_group_stats(df, cles, {
+        'Accidents': ('Num_Acc', 'count'),
+        'Décès': ('nb_tues', 'sum'),
+        'Blessés graves': ('nb_blesses_hospitalises', 'sum'),
+        'score_somme': ('score_gravite', 'sum'),
+        'score_n': ('score_gravite', 'count')
+    })
+    
+    communes['Département'] = normalize_department_codes(communes['dep'])
+    communes['Commune'] = normalize_commune_codes(communes['com']) if 'com' in communes.columns else ''
+    communes = communes[communes['Département'] != ''].drop(columns=cles)
+    mesures = ['Accidents', 'Décès', 'Blessés graves', 'score_somme', 'score_n']
+    
+    # Remontée des sommes : commune -> département -> région
+    departements = communes.groupby('Département', as_index=False)[mesures].sum()
+    departements['Région'] = departements['Département'].map(DEPARTEMENT_REGION).fillna('Autre')
+    regions = departements.groupby('Région', as_index=False)[mesures].sum()
+    
+    communes = _finalize_geo_measures(communes)
+    departements = _finalize_geo_measures(departements)
+    
+    return {
+        'regions': _finalize_geo_measures(regions),
+        'departements': departements,
+        'departements_par_region': {r: t for r, t in departements.groupby('Région')},
+        'communes_par_departement': {d: t for d, t in communes.groupby('Département')}
+    }
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_geo_hierarchy(cache_key, _df):
+    """Agrégats géographiques mis en cache par (version des données, état des filtres, barème)"""
+    note_cache_miss()
+    return compute_geo_hierarchy(_df)
+
+def create_geo_level_chart(table, niveau, top_n=15):
+    """Barres horizontales d'un niveau géographique (accidents, couleur = taux de mortalité)"""
+    if table is None or table.empty:
+        return go.Figure()
+    
+    top = table.nlargest(top_n, 'Accidents').iloc[::-1]
+    
+    fig = go.Figure(go.Bar(
+        y=top[niveau].astype(str),
+        x=top['Accidents'],
+        orientation='h',
+        marker=dict(color=top['Taux de mortalité'], colorscale='Reds', showscale=True,
+                    colorbar=dict(title="Décès /<br>100 acc.")),
+        customdata=top[['Décès', 'Gravité moyenne']],
+        hovertemplate=f"<b>{niveau} %{{y}}</b><br>" +
+                     "Accidents: %{x:,}<br>" +
+                     "Décès: %{customdata[0]:,}<br>" +
+                     "Gravité moyenne: %{customdata[1]:.1f}<extra></extra>"
+    ))
+    
+    fig.update_layout(
+        xaxis_title="Nombre d'accidents",
+        yaxis=dict(type='category'),
+        height=max(300, 28 * len(top) + 100),
+        margin=dict(t=30),
+        template='plotly_white'
+    )
+    
+    return fig
+
+def _selected_label(event):
+    """Libellé (axe y) de la barre cliquée dans un graphique à sélection, sinon None"""
+    points = event.selection.points if event else []
+    return str(points[0]['y']) if points else None
+
+def _simplify_ring(anneau, decimales):
+    """Arrondit les sommets d'un anneau et supprime les doublons consécutifs"""
+    points = np.round(np.asarray(anneau, dtype=np.float64)[:, :2], decimales)
+    garde = np.ones(len(points), dtype=bool)
+    garde[1:] = np.any(points[1:] != points[:-1], axis=1)
+    points = points[garde]
+    if len(points) < 4:
         return None
-    
-    if 'lat' not in df.columns or 'long' not in df.columns:
+    return points.tolist()
+
+def simplify_department_geojson(geojson, decimales=GEOMETRIE_DECIMALES):
+    """Simplifie les contours (quantification des coordonnées) et ne garde que code/nom"""
+    features = []
+    for feature in geojson.get('features', []):
+        geometrie = feature.get('geometry') or {}
+        polygones = geometrie.get('coordinates', [])
+        if geometrie.get('type') == 'Polygon':
+            polygones = [polygones]
+        elif geometrie.get('type') != 'MultiPolygon':
+            continue
+        
+        simplifies = []
+        for polygone in polygones:
+            anneaux = [_simplify_ring(anneau, decimales) for anneau in polygone]
+            if anneaux and anneaux[0] is not None:
+                simplifies.append([a for a in anneaux if a is not None])
+        if not simplifies:
+            continue
+        
+        proprietes = feature.get('properties', {})
+        features.append({
+            'type': 'Feature',
+            'properties': {'code': str(proprietes.get('code', '')), 'nom': proprietes.get('nom', '')},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': simplifies}
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+@st.cache_resource(show_spinner=False)
+def prepare_department_geometry(version, source=DEPARTEMENTS_GEOJSON, cible=DEPARTEMENTS_STATIQUE):
+    """Simplifie et sérialise les contours une seule fois par version du fichier source
+
+    Retourne l'URL statique des contours, ou None si le GeoJSON source est absent.
+    """
+    if version == 'absent':
         return None
-    
-    # Filtrer les données avec coordonnées valides
-    df_map = df.dropna(subset=['lat', 'long']).copy()
-    
-    if len(df_map) == 0:
+    try:
+        with open(source, encoding='utf-8') as f:
+            geojson = simplify_department_geojson(json.load(f))
+        os.makedirs(os.path.dirname(cible), exist_ok=True)
+        with open(cible, 'w', encoding='utf-8') as f:
+            json.dump(geojson, f, separators=(',', ':'))
+    except (OSError, ValueError):
         return None
+    return DEPARTEMENTS_URL
+
+def create_department_choropleth(dept_stats, mesure, geojson_url):
+    """Choroplèthe des départements ; seuls codes et valeurs voyagent avec la figure"""
+    if dept_stats.empty or geojson_url is None:
+        return go.Figure()
     
-    # Échantillonnage si trop de points
-    if len(df_map) > 5000:
-        df_map = df_map.sample(5000, random_state=42)
+    formats = {'Décès': '%{z:,.0f}', 'Taux de mortalité': '%{z:.2f} décès / 100 accidents',
+               'Gravité moyenne': '%{z:.1f}'}
     
-    try:
-        # Créer la carte centrée sur la France
-        m = folium.Map(
-            location=[46.603354, 1.888334],
-            zoom_start=6,
-            tiles='OpenStreetMap',
-            prefer_canvas=True  # AJOUTER CETTE LIGNE
-        )
-        
-        # Ajouter une heatmap
-        from folium.plugins import HeatMap
-        
-        # Préparer les données pour la heatmap
-        heat_data = [[row['lat'], row['long'], row.get('score_gravite', 1)] 
-                     for idx, row in df_map.iterrows()]
-        
-        HeatMap(
-            heat_data,
-            min_opacity=0.2,
-            max_zoom=18,
-            radius=15,
-            blur=15,
-            gradient={
-                0.0: 'blue',
-                0.5: 'yellow',
-                0.8: 'orange',
-                1.0: 'red'
-            }
-        ).add_to(m)
-        
-        # Ajouter des marqueurs pour les accidents mortels
-        if 'accident_mortel' in df_map.columns:
-            df_mortel = df_map[df_map['accident_mortel'] == 1].head(100)
-            
-            for idx, row in df_mortel.iterrows():
-                folium.CircleMarker(
-                    location=[row['lat'], row['long']],
-                    radius=5,
-                    popup=f"Accident mortel<br>Décès: {row.get('nb_tues', 'N/A')}",
-                    color='red',
-                    fill=True,
-                    fillColor='red',
-                    fillOpacity=0.7
-                ).add_to(m)
-        
-        return m
+    fig = go.Figure(go.Choropleth(
+        geojson=geojson_url,
+        featureidkey='properties.code',
+        locations=dept_stats['Département'],
+        z=dept_stats[mesure],
+        colorscale='Reds',
+        marker_line_width=0.3,
+        marker_line_color='white',
+        colorbar=dict(title=mesure),
+        customdata=dept_stats[['Accidents', 'Décès']],
+        hovertemplate="<b>Département %{location}</b><br>" +
+                     f"{mesure}: {formats[mesure]}<br>" +
+                     "Accidents: %{customdata[0]:,}<br>" +
+                     "Décès: %{customdata[1]:,}<extra></extra>"
+    ))
     
-    except Exception as e:
-        st.error(f"Erreur création carte: {e}")
-        return None
+    fig.update_geos(
+        visible=False,
+        projection_type='conic conformal',
+        lataxis_range=list(FRANCE_LAT),
+        lonaxis_range=list(FRANCE_LONG)
+    )
+    fig.update_layout(
+        title=f"🗺️ {mesure} par département",
+        height=650,
+        margin=dict(l=0, r=0, t=50, b=0),
+        template='plotly_white'
+    )
+    
+    return fig
 
-def create_department_analysis(df):
+def create_department_analysis(dept_stats):
     """Analyse par département"""
-    if df.empty or 'dep' not in df.columns:
+    if dept_stats.empty:
         return go.Figure()
     
-    # Agrégation par département
-    dept_stats = df.groupby('dep').agg({
-        'Num_Acc': 'count',
-        'nb_tues': 'sum',
-        'nb_blesses_hospitalises': 'sum',
-        'score_gravite': 'mean'
-    }).reset_index()
-    dept_stats.columns = ['Département', 'Accidents', 'Décès', 'Blessés graves', 'Gravité moyenne']
-    
     # Top 15 départements par nombre de décès
     top_dept = dept_stats.nlargest(15, 'Décès')
     
@@ -514,16 +2334,18 @@ def create_department_analysis(df):
 
 def create_risk_factors_analysis(df):
     """Analyse des facteurs de risque"""
+    import plotly.express as px
+
     if df.empty:
         return go.Figure(), go.Figure()
     
     # Graphique 1: Conditions météo
     if 'atm_desc' in df.columns:
-        meteo_stats = df.groupby('atm_desc').agg({
+        meteo_stats = query_group_stats(df, 'atm_desc', {
             'accident_mortel': 'mean',
             'Num_Acc': 'count',
             'score_gravite': 'mean'
-        }).reset_index()
+        })
         meteo_stats.columns = ['Conditions', 'Taux mortalité', 'Nombre', 'Gravité']
         meteo_stats['Taux mortalité'] = meteo_stats['Taux mortalité'] * 100
         meteo_stats = meteo_stats.sort_values('Gravité', ascending=False)
@@ -548,11 +2370,11 @@ def create_risk_factors_analysis(df):
     
     # Graphique 2: Luminosité
     if 'lum_desc' in df.columns:
-        lum_stats = df.groupby('lum_desc').agg({
+        lum_stats = query_group_stats(df, 'lum_desc', {
             'Num_Acc': 'count',
             'nb_tues': 'sum',
             'score_gravite': 'mean'
-        }).reset_index()
+        })
         lum_stats.columns = ['Luminosité', 'Accidents', 'Décès', 'Gravité']
         
         fig_lum = go.Figure(data=[
@@ -577,133 +2399,436 @@ def create_risk_factors_analysis(df):
     
     return fig_meteo, fig_lum
 
-def create_accident_concentration_analysis(df):
+def project_coordinates(lat, lon):
+    """Projette lat/long (degrés) en mètres (équirectangulaire centrée sur la France)"""
+    rayon_terre = 6_371_000.0
+    x = rayon_terre * np.radians(lon) * np.cos(np.radians(FRANCE_CENTRE[0]))
+    y = rayon_terre * np.radians(lat)
+    return x, y
+
+def build_grid_index(x, y, pas_m):
+    """Index spatial par hachage sur grille : accidents triés par cellule et bornes de chaque cellule"""
+    ix = np.floor(x / pas_m).astype(np.int64)
+    iy = np.floor(y / pas_m).astype(np.int64)
+    ix -= ix.min() - 1
+    iy -= iy.min() - 1
+    largeur = int(iy.max()) + 2
+    code = ix * largeur + iy
+    
+    ordre = np.argsort(code, kind='stable')
+    code_trie = code[ordre]
+    debut = np.flatnonzero(np.r_[True, code_trie[1:] != code_trie[:-1]])
+    return {'ordre': ordre, 'code': code_trie, 'cellules': code_trie[debut], 'debut': debut,
+            'fin': np.r_[debut[1:], len(code_trie)], 'largeur': largeur,
+            'x': x[ordre], 'y': y[ordre], 'pas_m': pas_m}
+
+def pairs_within_radius(index, requetes, rayon_m):
+    """Couples (requête, accident) à moins de `rayon_m`, en positions triées de l'index
+
+    `requetes` sont des positions dans l'index ; la grille (pas >= rayon_m) ne sert qu'à
+    limiter les candidats aux 3x3 cellules voisines : le résultat, fondé sur les
+    distances exactes, ne dépend pas du calage de la grille.
+    """
+    qx, qy = index['x'][requetes], index['y'][requetes]
+    cellules, largeur = index['cellules'], index['largeur']
+    paires_q, paires_j = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            cible = index['code'][requetes] + dx * largeur + dy
+            pos = np.clip(np.searchsorted(cellules, cible), 0, len(cellules) - 1)
+            present = cellules[pos] == cible
+            debut = np.where(present, index['debut'][pos], 0)
+            nombre = np.where(present, index['fin'][pos] - index['debut'][pos], 0)
+            
+            # Expansion vectorisée : une ligne par accident de la cellule voisine
+            q = np.repeat(np.arange(len(requetes)), nombre)
+            j = np.repeat(debut, nombre) + (np.arange(len(q)) - np.repeat(np.cumsum(nombre) - nombre, nombre))
+            proche = (index['x'][j] - qx[q]) ** 2 + (index['y'][j] - qy[q]) ** 2 <= rayon_m ** 2
+            paires_q.append(q[proche])
+            paires_j.append(j[proche])
+    return np.concatenate(paires_q), np.concatenate(paires_j)
+
+def compute_hotspots(df, rayon_m=HOTSPOT_RAYON_M, min_accidents=HOTSPOT_MIN_ACCIDENTS, top_n=20):
+    """Détecte les points noirs par regroupement spatial dans un rayon
+
+    Les accidents sont projetés en mètres ; chacun reçoit le nombre d'accidents situés
+    à moins de `rayon_m` (distances exactes, grille de hachage comme seul index). Les
+    accidents les plus denses deviennent des centres de points noirs, à condition d'être
+    à plus de 2 x `rayon_m` des centres déjà retenus (disques disjoints) ; les égalités
+    sont départagées par l'ordre des données. Aucune étape ne dépend du calage de la
+    grille : décaler celle-ci ne change pas les points noirs.
+    Retourne les `top_n` points noirs d'au moins `min_accidents` accidents.
+    """
+    colonnes = ['Accidents', 'Décès', 'Blessés graves', 'Gravité',
+                'Latitude', 'Longitude', 'Département', 'Commune']
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['long'].to_numpy(dtype=np.float64)
+    valides = np.isfinite(lat) & np.isfinite(lon)
+    if not valides.any():
+        return pd.DataFrame(columns=colonnes)
+
+    lat, lon = lat[valides], lon[valides]
+    x, y = project_coordinates(lat, lon)
+    index = build_grid_index(x, y, rayon_m)
+    ordre = index['ordre']
+    
+    # Élagage exact : la densité d'un accident est bornée par l'effectif de ses 3x3 cellules
+    effectifs = index['fin'] - index['debut']
+    fenetre = np.zeros(len(effectifs), dtype=np.int64)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            cible = index['cellules'] + dx * index['largeur'] + dy
+            pos = np.clip(np.searchsorted(index['cellules'], cible), 0, len(effectifs) - 1)
+            fenetre += np.where(index['cellules'][pos] == cible, effectifs[pos], 0)
+    requetes = np.flatnonzero(np.repeat(fenetre, effectifs) >= min_accidents)
+    
+    # Densité des accidents restants : voisins à moins de rayon_m (lui compris)
+    densite = np.zeros(len(ordre), dtype=np.int64)
+    densite[requetes] = np.bincount(pairs_within_radius(index, requetes, rayon_m)[0], minlength=len(requetes))
+    
+    # Candidats par densité décroissante, égalités dans l'ordre des données
+    candidats = np.flatnonzero(densite >= min_accidents)
+    candidats = candidats[np.lexsort((ordre[candidats], -densite[candidats]))]
+    
+    # Suppression des non-maxima : un centre à moins de 2 x rayon_m d'un centre retenu est écarté
+    # (filtre vectorisé par blocs, puis passage séquentiel sur les survivants du bloc)
+    centres = []
+    distance_min = (2 * rayon_m) ** 2
+    for bloc in range(0, len(candidats), 1024):
+        if len(centres) == top_n:
+            break
+        survivants = candidats[bloc:bloc + 1024]
+        if centres:
+            retenus = np.array(centres)
+            d2 = ((index['x'][survivants, None] - index['x'][retenus]) ** 2 +
+                  (index['y'][survivants, None] - index['y'][retenus]) ** 2)
+            survivants = survivants[(d2 > distance_min).all(axis=1)]
+        nouveaux = len(centres)  # seuls les centres retenus dans ce bloc restent à vérifier
+        for pos in survivants:
+            if len(centres) == top_n:
+                break
+            if all((index['x'][pos] - index['x'][c]) ** 2 + (index['y'][pos] - index['y'][c]) ** 2 > distance_min
+                   for c in centres[nouveaux:]):
+                centres.append(pos)
+
+    if not centres:
+        return pd.DataFrame(columns=colonnes)
+    
+    # Totaux des disques retenus
+    centres = np.array(centres)
+    q, j = pairs_within_radius(index, centres, rayon_m)
+    
+    def colonne(nom):
+        if nom in df.columns:
+            return df[nom].to_numpy(dtype=np.float64, na_value=0)[valides][ordre]
+        return np.zeros(len(ordre))
+    
+    def somme(valeurs):
+        return np.bincount(q, weights=valeurs[j], minlength=len(centres))
+    
+    nombre = somme(np.ones(len(ordre)))
+    origine = ordre[centres]
+    return pd.DataFrame({
+        'Accidents': nombre.astype(int),
+        'Décès': somme(colonne('nb_tues')).astype(int),
+        'Blessés graves': somme(colonne('nb_blesses_hospitalises')).astype(int),
+        'Gravité': somme(colonne('score_gravite')) / nombre,
+        'Latitude': somme(lat[ordre]) / nombre,
+        'Longitude': somme(lon[ordre]) / nombre,
+        'Département': df['dep'].to_numpy()[valides][origine] if 'dep' in df.columns else np.nan,
+        'Commune': df['com'].to_numpy()[valides][origine] if 'com' in df.columns else np.nan
+    })
+
+# Style de chaque point noir lu dans les propriétés de l'entité GeoJSON
+# Couleur des points noirs par classe de gravité (ordre de CATEGORIES_GRAVITE)
+HOTSPOT_COULEURS = ['yellow', 'orange', 'red', 'darkred']
+
+HOTSPOT_STYLE_JS = """
+function (feature, layer) {
+    layer.setStyle({
+        color: feature.properties.couleur,
+        fillColor: feature.properties.couleur,
+        radius: feature.properties.rayon
+    });
+}
+"""
+
+def _format_code_geo(serie):
+    """Formate une colonne de codes géographiques (dep/com) en texte, vide si manquant"""
+    if pd.api.types.is_numeric_dtype(serie):
+        texte = serie.round().astype('Int64').astype('string')
+    else:
+        texte = serie.astype('string').str.strip()
+    return texte.fillna('').replace('nan', '')
+
+def hotspot_legend_html(seuils=BAREME_DEFAUT[1]):
+    """Légende des points noirs : une ligne par classe, bornes issues du barème"""
+    plages = [f"≤ {seuils[0]:g}", f"{seuils[0]:g} – {seuils[1]:g}",
+              f"{seuils[1]:g} – {seuils[2]:g}", f"> {seuils[2]:g}"]
+    lignes = '<br>'.join(
+        f'<span style="color: {couleur};">⬤</span> {categorie} ({plage})'
+        for couleur, categorie, plage in reversed(list(zip(HOTSPOT_COULEURS, CATEGORIES_GRAVITE, plages)))
+    )
+    return f"""
+        <div style="position: fixed; bottom: 50px; right: 50px; width: 230px; 
+                    background-color: white; z-index:9999; font-size:12px;
+                    border:2px solid grey; border-radius: 5px; padding: 8px">
+        <b>🎯 Gravité moyenne</b><hr style="margin: 3px 0;">
+        {lignes}
+        </div>
+        """
+
+def build_hotspots_layer(hotspots, seuils=BAREME_DEFAUT[1]):
+    """Construit le calque GeoJSON des points noirs (une FeatureCollection unique)
+
+    La couleur suit la classe de gravité de la gravité moyenne, selon les bornes `seuils`.
+    """
+    import folium
+
+    gravite = hotspots['Gravité']
+    accidents = hotspots['Accidents'].fillna(0).astype(int)
+    commune = normalize_commune_codes(hotspots['Commune'])
+    dept = normalize_department_codes(hotspots['Département']).replace('', 'N/A')
+
+    proprietes = pd.DataFrame({
+        'Rang': [f"#{i}" for i in range(1, len(hotspots) + 1)],
+        'Localisation': np.where(commune != '', commune + ' (' + dept + ')', 'Dép. ' + dept),
+        'Accidents': accidents,
+        'Décès': hotspots['Décès'].fillna(0).astype(int),
+        'Gravité': gravite.round(0).astype('Int64').astype('string').fillna('N/A'),
+        'couleur': np.select(
+            [gravite > seuils[2], gravite > seuils[1], gravite > seuils[0], gravite.notna()],
+            HOTSPOT_COULEURS[::-1],
+            default='gray'
+        ),
+        'rayon': np.where(accidents > 0, 8 + accidents / 10, 8).round(1)
+    })
+
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': props
+        }
+        for lon, lat, props in zip(
+            hotspots['Longitude'].round(6).tolist(),
+            hotspots['Latitude'].round(6).tolist(),
+            proprietes.to_dict('records')
+        )
+    ]
+
+    return folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        name='Points noirs',
+        marker=folium.CircleMarker(fill=True, fill_opacity=0.6, weight=2),
+        on_each_feature=folium.JsCode(HOTSPOT_STYLE_JS),
+        popup=folium.GeoJsonPopup(
+            fields=['Rang', 'Localisation', 'Accidents', 'Décès', 'Gravité'],
+            aliases=['⚠️ Point', '📍', '🚨 Accidents', '💀 Décès', '⚠️ Gravité']
+        ),
+        tooltip=folium.GeoJsonTooltip(fields=['Rang', 'Accidents'], aliases=['Point', 'Accidents'])
+    )
+
+def create_accident_concentration_analysis(df, rayon_m=HOTSPOT_RAYON_M,
+                                           min_accidents=HOTSPOT_MIN_ACCIDENTS, top_n=20,
+                                           seuils=BAREME_DEFAUT[1]):
     """Analyse de la concentration des accidents avec carte interactive - OPTIMISÉE"""
+    import folium
+
     if df.empty:
         return None
     
     # Créer une carte des points noirs si on a les coordonnées
     if 'lat' in df.columns and 'long' in df.columns:
-        # Grouper par coordonnées approximatives (arrondir pour regrouper les accidents proches)
-        df_geo = df.dropna(subset=['lat', 'long']).copy()
-        
-        if len(df_geo) == 0:
+        if df['lat'].notna().sum() == 0 or df['long'].notna().sum() == 0:
             return None
         
-        # Arrondir à 3 décimales
-        df_geo['lat_round'] = df_geo['lat'].round(3)
-        df_geo['long_round'] = df_geo['long'].round(3)
-        
-        # Utiliser des agrégations plus simples
-        hotspots = df_geo.groupby(['lat_round', 'long_round']).agg({
-            'Num_Acc': 'count',
-            'nb_tues': 'sum',
-            'nb_blesses_hospitalises': 'sum',
-            'score_gravite': 'mean',
-            'lat': 'mean',
-            'long': 'mean',
-            'dep': 'first',
-            'com': lambda x: x.iloc[0] if len(x) > 0 and 'com' in df.columns else ''
-        }).reset_index()
-        
-        hotspots.columns = ['Lat_round', 'Long_round', 'Accidents', 'Décès', 'Blessés graves', 'Gravité', 'Latitude', 'Longitude', 'Département', 'Commune']
-        
-        # Top 20 points chauds
-        top_hotspots = hotspots.nlargest(20, 'Accidents').reset_index(drop=True)
+        # Points noirs par regroupement spatial (voisinages fusionnés)
+        top_hotspots = compute_hotspots(df, rayon_m=rayon_m, min_accidents=min_accidents, top_n=top_n)
         
         # Créer la carte plus simplement
         hot_spots_map = folium.Map(
-            location=[46.603354, 1.888334],
-            zoom_start=6,
+            location=FRANCE_CENTRE,
+            zoom_start=ZOOM_FRANCE,
             tiles='OpenStreetMap',
             prefer_canvas=True
         )
         
-        # Légende simplifiée
-        legend_html = """
-        <div style="position: fixed; bottom: 50px; right: 50px; width: 180px; 
-                    background-color: white; z-index:9999; font-size:12px;
-                    border:2px solid grey; border-radius: 5px; padding: 8px">
-        <b>🎯 Gravité</b><hr style="margin: 3px 0;">
-        <span style="color: darkred;">⬤</span> Très grave<br>
-        <span style="color: red;">⬤</span> Grave<br>
-        <span style="color: orange;">⬤</span> Modéré<br>
-        <span style="color: yellow;">⬤</span> Faible
-        </div>
-        """
-        hot_spots_map.get_root().html.add_child(folium.Element(legend_html))
-        
-        # Simplifier les marqueurs - CORRECTION ICI
-        for idx, spot in top_hotspots.iterrows():
-            # Couleur selon gravité
-            gravite = spot['Gravité']
-            if pd.notna(gravite):
-                if gravite > 150:
-                    color = 'darkred'
-                elif gravite > 100:
-                    color = 'red'
-                elif gravite > 50:
-                    color = 'orange'
-                else:
-                    color = 'yellow'
-            else:
-                color = 'gray'
-            
-            # Nom de localisation simplifié - CORRECTION ICI
-            commune = spot['Commune']
-            dept = spot['Département']
-            
-            # Convertir en string et nettoyer
-            commune_str = str(commune) if pd.notna(commune) and str(commune) != 'nan' and str(commune) != '' else None
-            dept_str = str(dept) if pd.notna(dept) else 'N/A'
-            
-            if commune_str:
-                location_name = f"{commune_str} ({dept_str})"
-            else:
-                location_name = f"Dép. {dept_str}"
-            
-            # Popup HTML simplifié
-            accidents = int(spot['Accidents']) if pd.notna(spot['Accidents']) else 0
-            deces = int(spot['Décès']) if pd.notna(spot['Décès']) else 0
-            gravite_str = f"{gravite:.0f}" if pd.notna(gravite) else 'N/A'
-            
-            popup_html = f"""
-            <b>⚠️ Point #{idx+1}</b><br>
-            📍 {location_name}<br>
-            🚨 {accidents} accidents<br>
-            💀 {deces} décès<br>
-            ⚠️ Gravité: {gravite_str}
-            """
-            
-            coords = [spot['Latitude'], spot['Longitude']]
-            
-            # UN SEUL marqueur par point
-            folium.CircleMarker(
-                location=coords,
-                radius=8 + (accidents / 10) if accidents > 0 else 8,
-                popup=folium.Popup(popup_html, max_width=200),
-                tooltip=f"#{idx+1}: {accidents} accidents",
-                color=color,
-                fill=True,
-                fillColor=color,
-                fillOpacity=0.6,
-                weight=2
-            ).add_to(hot_spots_map)
+        # Légende : classes et bornes du barème de gravité
+        hot_spots_map.get_root().html.add_child(folium.Element(hotspot_legend_html(seuils)))
+        
+        # Un seul calque GeoJSON : style et popups calculés en colonnes, appliqués côté navigateur
+        if len(top_hotspots) > 0:
+            build_hotspots_layer(top_hotspots, seuils).add_to(hot_spots_map)
         
         return hot_spots_map
     
     return None
 
+def build_spatial_index(df, cellule_m=RECHERCHE_CELLULE_M):
+    """Index spatial par grille de hachage sur les coordonnées projetées en mètres
+
+    Les accidents géolocalisés sont triés par code de cellule : une requête ne lit que
+    les cellules couvrant son rayon (recherche binaire dans les codes triés).
+    """
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['long'].to_numpy(dtype=np.float64)
+    valides = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+    x, y = project_coordinates(lat[valides], lon[valides])
+
+    cx = np.floor(x / cellule_m).astype(np.int64)
+    cy = np.floor(y / cellule_m).astype(np.int64)
+    origine = (int(cx.min()), int(cy.min())) if len(valides) else (0, 0)
+    dims = (int(cx.max()) - origine[0] + 1, int(cy.max()) - origine[1] + 1) if len(valides) else (0, 0)
+    codes = (cx - origine[0]) * dims[1] + (cy - origine[1])
+
+    ordre = np.argsort(codes, kind='stable')
+    return {
+        'positions': valides[ordre],
+        'x': x[ordre],
+        'y': y[ordre],
+        'codes': codes[ordre],
+        'cellule_m': cellule_m,
+        'origine': origine,
+        'dims': dims
+    }
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_spatial_index(cle, _df):
+    """Index spatial construit une fois par version des données (et sélection de partitions)"""
+    note_cache_miss()
+    return build_spatial_index(_df)
+
+def query_radius(index, lat, lon, rayon_m, masque=None):
+    """Accidents à moins de `rayon_m` mètres d'un point, du plus proche au plus éloigné
+
+    `masque` (booléens par ligne du DataFrame indexé) restreint la recherche, par
+    exemple aux accidents retenus par les filtres. Retourne (positions, distances en m).
+    """
+    vide = (np.empty(0, dtype=np.int64), np.empty(0))
+    if len(index['positions']) == 0:
+        return vide
+
+    x0, y0 = project_coordinates(np.float64(lat), np.float64(lon))
+    pas = index['cellule_m']
+    (cx0, cy0), (nx, ny) = index['origine'], index['dims']
+    ix = np.arange(max(int(np.floor((x0 - rayon_m) / pas)) - cx0, 0),
+                   min(int(np.floor((x0 + rayon_m) / pas)) - cx0, nx - 1) + 1)
+    iy = np.arange(max(int(np.floor((y0 - rayon_m) / pas)) - cy0, 0),
+                   min(int(np.floor((y0 + rayon_m) / pas)) - cy0, ny - 1) + 1)
+    if len(ix) == 0 or len(iy) == 0:
+        return vide
+
+    # Tranches des cellules couvertes dans l'ordre de l'index, concaténées sans boucle
+    cellules = (ix[:, None] * ny + iy[None, :]).ravel()
+    debut = np.searchsorted(index['codes'], cellules, side='left')
+    longueurs = np.searchsorted(index['codes'], cellules, side='right') - debut
+    candidats = (np.arange(longueurs.sum()) - np.repeat(np.cumsum(longueurs) - longueurs, longueurs)
+                 + np.repeat(debut, longueurs))
+
+    if masque is not None:
+        candidats = candidats[masque[index['positions'][candidats]]]
+    distances = np.hypot(index['x'][candidats] - x0, index['y'][candidats] - y0)
+    dedans = distances <= rayon_m
+    ordre = np.argsort(distances[dedans], kind='stable')
+    return index['positions'][candidats[dedans][ordre]], distances[dedans][ordre]
+
+def query_nearest(index, lat, lon, k, masque=None):
+    """k accidents les plus proches d'un point : rayon doublé jusqu'à en contenir k
+
+    Tous les accidents à moins du rayon final sont examinés, les k premiers sont donc
+    exacts. Retourne (positions, distances en m).
+    """
+    total = len(index['positions']) if masque is None else int(masque.sum())
+    k = min(k, total)
+    rayon = index['cellule_m']
+    while True:
+        positions, distances = query_radius(index, lat, lon, rayon, masque)
+        # 4 000 km couvrent toute la métropole depuis n'importe quel point cliqué
+        if len(positions) >= k or rayon > 4_000_000:
+            return positions[:k], distances[:k]
+        rayon *= 2
+
+def search_results_table(df, positions, distances, bareme=BAREME_DEFAUT):
+    """Tableau des accidents trouvés (un accident par ligne, distance en mètres)"""
+    colonnes = {
+        'date': 'Date', 'heure': 'Heure', 'dep': 'Département', 'com': 'Commune',
+        'categorie_gravite': 'Gravité', 'nb_tues': 'Décès',
+        'nb_blesses_hospitalises': 'Blessés graves', 'nb_blesses_legers': 'Blessés légers',
+        'col_desc': 'Collision', 'catr_desc': 'Route'
+    }
+    presentes = [c for c in colonnes if c in df.columns]
+    table = apply_severity_scale(df.iloc[positions], bareme)[presentes].rename(columns=colonnes)
+    if 'Date' in table.columns:
+        table['Date'] = table['Date'].dt.strftime('%d/%m/%Y')
+    if 'Commune' in table.columns:
+        table['Commune'] = normalize_commune_codes(table['Commune'])
+    if 'Département' in table.columns:
+        table['Département'] = normalize_department_codes(table['Département'])
+    table.insert(0, 'Distance (m)', np.round(distances).astype(int))
+    return table.reset_index(drop=True)
+
+def build_search_layer(df, positions, point, rayon_m=None):
+    """Calque des résultats : cercle de recherche et accidents colorés selon la gravité"""
+    import folium
+
+    groupe = folium.FeatureGroup(name='Recherche')
+    folium.Marker(point, tooltip="Point recherché").add_to(groupe)
+    if rayon_m is not None:
+        folium.Circle(point, radius=rayon_m, color='#2c3e50', weight=2, fill=False).add_to(groupe)
+
+    positions = positions[:RECHERCHE_MARQUEURS_MAX]
+    if len(positions) == 0:
+        return groupe
+
+    resultats = df.iloc[positions]
+    mortel = (resultats['accident_mortel'].to_numpy(dtype=bool) if 'accident_mortel' in resultats.columns
+              else np.zeros(len(resultats), dtype=bool))
+    grave = (resultats['nb_blesses_hospitalises'].fillna(0).to_numpy() > 0
+             if 'nb_blesses_hospitalises' in resultats.columns else np.zeros(len(resultats), dtype=bool))
+    couleurs = np.select([mortel, grave], ['darkred', 'orange'], default='#3498db')
+    gravite = (resultats['categorie_gravite'].astype('string').fillna('N/A')
+               if 'categorie_gravite' in resultats.columns else pd.Series('N/A', index=resultats.index))
+
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'couleur': couleur, 'Gravité': g}
+        }
+        for lon, lat, couleur, g in zip(
+            resultats['long'].astype(np.float64).round(6).tolist(),
+            resultats['lat'].astype(np.float64).round(6).tolist(),
+            couleurs.tolist(),
+            gravite.tolist()
+        )
+    ]
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        marker=folium.CircleMarker(radius=5, fill=True, fill_opacity=0.8, weight=1),
+        style_function=lambda f: {'color': f['properties']['couleur'], 'fillColor': f['properties']['couleur']},
+        tooltip=folium.GeoJsonTooltip(fields=['Gravité'], aliases=['Gravité'])
+    ).add_to(groupe)
+    return groupe
+
+def _store_search_point():
+    """Rappel de la carte de recherche : mémorise le dernier point cliqué"""
+    clic = (st.session_state.get('recherche_carte') or {}).get('last_clicked')
+    if clic:
+        st.session_state['recherche_point'] = (clic['lat'], clic['lng'])
+
 def create_collision_type_analysis(df):
     """Analyse des types de collision"""
+    import plotly.express as px
+
     if df.empty or 'col_desc' not in df.columns:
         return go.Figure()
     
-    collision_stats = df.groupby('col_desc').agg({
+    collision_stats = query_group_stats(df, 'col_desc', {
         'Num_Acc': 'count',
         'nb_tues': 'sum',
         'score_gravite': 'mean'
-    }).reset_index()
+    })
     collision_stats.columns = ['Type de collision', 'Accidents', 'Décès', 'Gravité']
     collision_stats = collision_stats.sort_values('Gravité', ascending=False)
     
@@ -723,16 +2848,18 @@ def create_collision_type_analysis(df):
 
 def create_infrastructure_analysis(df):
     """Analyse des infrastructures dangereuses"""
+    import plotly.express as px
+
     if df.empty:
         return go.Figure(), go.Figure()
     
     # Graphique 1: Profil de la route
     if 'prof_desc' in df.columns:
-        profile_stats = df.groupby('prof_desc').agg({
+        profile_stats = query_group_stats(df, 'prof_desc', {
             'Num_Acc': 'count',
             'nb_tues': 'sum',
             'score_gravite': 'mean'
-        }).reset_index()
+        })
         profile_stats.columns = ['Profil', 'Accidents', 'Décès', 'Gravité']
         
         fig_profile = px.bar(
@@ -749,11 +2876,11 @@ def create_infrastructure_analysis(df):
     
     # Graphique 2: Plan de la route
     if 'plan_desc' in df.columns:
-        plan_stats = df.groupby('plan_desc').agg({
+        plan_stats = query_group_stats(df, 'plan_desc', {
             'Num_Acc': 'count',
             'accident_mortel': 'mean',
             'score_gravite': 'mean'
-        }).reset_index()
+        })
         plan_stats.columns = ['Configuration', 'Accidents', 'Taux mortalité', 'Gravité']
         plan_stats['Taux mortalité'] = plan_stats['Taux mortalité'] * 100
         
@@ -775,17 +2902,14 @@ def create_infrastructure_analysis(df):
     
     return fig_profile, fig_plan
 
-def create_monthly_analysis(df):
+def create_monthly_analysis(cube):
     """Crée une analyse par mois"""
-    if df.empty or 'mois' not in df.columns:
+    from plotly.subplots import make_subplots
+
+    if cube.empty:
         return go.Figure()
     
-    monthly_stats = df.groupby('mois').agg({
-        'Num_Acc': 'count',
-        'nb_tues': 'sum',
-        'nb_blesses_hospitalises': 'sum',
-        'score_gravite': 'mean'
-    }).reset_index()
+    monthly_stats = rollup_temporal(cube, 'mois')
     
     mois_noms = ['Jan', 'Fév', 'Mar', 'Avr', 'Mai', 'Jun', 
                  'Jul', 'Aoû', 'Sep', 'Oct', 'Nov', 'Déc']
@@ -832,18 +2956,15 @@ def create_monthly_analysis(df):
     
     return fig
 
-def create_seasonal_analysis(df):
+def create_seasonal_analysis(cube):
     """Analyse par saison"""
-    if df.empty or 'saison' not in df.columns:
+    if cube.empty:
         return go.Figure()
     
     saison_order = ['Printemps', 'Été', 'Automne', 'Hiver']
-    seasonal_stats = df.groupby('saison').agg({
-        'Num_Acc': 'count',
-        'nb_tues': 'sum',
-        'accident_mortel': 'mean',
-        'score_gravite': 'mean'
-    }).reset_index()
+    seasonal_stats = rollup_temporal(cube, 'saison')[
+        ['saison', 'Num_Acc', 'nb_tues', 'accident_mortel', 'score_gravite']
+    ]
     seasonal_stats.columns = ['Saison', 'Accidents', 'Décès', 'Taux_mortalité', 'Gravité']
     seasonal_stats['Taux_mortalité'] = seasonal_stats['Taux_mortalité'] * 100
     
@@ -888,18 +3009,14 @@ def create_seasonal_analysis(df):
     
     return fig
 
-def create_weekday_analysis(df):
+def create_weekday_analysis(cube):
     """Analyse par jour de la semaine"""
-    if df.empty or 'jour_semaine' not in df.columns:
+    if cube.empty:
         return go.Figure()
     
     jours_noms = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
     
-    daily_stats = df.groupby('jour_semaine').agg({
-        'Num_Acc': 'count',
-        'nb_tues': 'sum',
-        'score_gravite': 'mean'
-    }).reset_index()
+    daily_stats = rollup_temporal(cube, 'jour_semaine')
     daily_stats['Jour'] = daily_stats['jour_semaine'].map(
         {i: jours_noms[i] for i in range(7)}
     )
@@ -932,9 +3049,7 @@ def create_weekday_analysis(df):
 # ============================================================================
 
 def main():
-    # Initialiser le session state pour les clés de carte
-    if 'map_counter' not in st.session_state:
-        st.session_state.map_counter = 0
+    start_perf_run(is_debug_mode())
     
     # Header avec animation
     st.markdown('<h1 class="main-header">🚦 Projet Streamlit </h1>', unsafe_allow_html=True)
@@ -973,13 +3088,52 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # Chargement des données
-    with st.spinner("⏳ Chargement des données..."):
-        df = load_data()
+    # Chargement des données : base complète si elle est prête, sinon aperçu immédiat
+    # sur l'échantillon stratifié (ou, à défaut, partitions élaguées par les filtres)
+    # pendant que le chargement se termine en arrière-plan
+    version = get_dataset_version()
+    manifeste = load_partition_manifest(get_dataset_version(PARTITIONS_MANIFEST))
+    apercu = None
+    df = None
+    cle_index_spatial = version
+    with perf_block("chargement des données") as mesure:
+        if version != 'absent':
+            # Base complète partagée par le processus (memory-map Arrow si à jour)
+            job = get_full_data_job(version)
+            start_cache_warmer(version)
+            if not job.done():
+                wait([job], timeout=APERCU_DELAI_S)
+            if not job.done() and is_derived_file_fresh():
+                apercu = load_sample_tier(get_dataset_version(ECHANTILLON_FILE))
+            if apercu is not None:
+                df = apercu
+            elif job.done() or manifeste is None or is_derived_file_fresh(ARROW_FILE):
+                # Copie Arrow à jour : l'ouverture par memory-map est quasi immédiate et
+                # partagée entre processus, préférable à des copies privées des partitions
+                with st.spinner("⏳ Chargement des données..."):
+                    df = job.result()
+        elif manifeste is None:
+            df = load_data()
+        
+        if df is None:
+            # Stockage partitionné, sans attendre la base complète : lecture différée
+            # après les filtres (élagage des partitions)
+            version = get_dataset_version(PARTITIONS_MANIFEST)
+            date_min = pd.Timestamp(manifeste['date_min']) if manifeste.get('date_min') else None
+            date_max = pd.Timestamp(manifeste['date_max']) if manifeste.get('date_max') else None
+            departements_dispo = sorted({p['dep'] for p in manifeste['partitions']} - {'nan', ''})
+        else:
+            mesure['lignes_sortie'] = len(df)
     
-    if df.empty:
-        st.error("Impossible de charger les données. Vérifiez que le fichier consolidé existe.")
-        return
+    if df is not None:
+        if df.empty:
+            st.error("Impossible de charger les données. Vérifiez que le fichier consolidé existe.")
+            return
+        date_min = date_max = None
+        if 'date' in df.columns and not df['date'].isna().all():
+            date_min = df['date'].min()
+            date_max = df['date'].max()
+        departements_dispo = department_options(df)
     
     # ========================================================================
     # SIDEBAR - FILTRES ET NAVIGATION
@@ -1008,10 +3162,8 @@ def main():
     # Filtres temporels
     st.sidebar.subheader("📅 Période d'analyse")
     
-    if 'date' in df.columns and not df['date'].isna().all():
-        date_min = df['date'].min()
-        date_max = df['date'].max()
-        
+    date_range = None
+    if date_min is not None:
         date_range = st.sidebar.date_input(
             "Sélectionner la période",
             value=(date_min, date_max),
@@ -1019,39 +3171,68 @@ def main():
             max_value=date_max,
             key='date_filter'
         )
-        
-        if len(date_range) == 2:
-            mask = (df['date'] >= pd.to_datetime(date_range[0])) & (df['date'] <= pd.to_datetime(date_range[1]))
-            df_filtered = df[mask]
-        else:
-            df_filtered = df.copy()
-    else:
-        df_filtered = df.copy()
     
     # Filtre gravité
     st.sidebar.subheader("⚠️ Niveau de gravité")
     
     gravite_options = st.sidebar.multiselect(
         "Types d'accidents à inclure",
-        options=['Mortels', 'Blessés graves', 'Blessés légers', 'Matériels'],
-        default=['Mortels', 'Blessés graves', 'Blessés légers', 'Matériels']  # TOUS par défaut
+        options=GRAVITE_OPTIONS,
+        default=GRAVITE_OPTIONS  # TOUS par défaut
     )
     
-    # Appliquer les filtres gravité - logique simplifiée
-    # Par défaut, on garde tout si tous les types sont sélectionnés
-    if len(gravite_options) == 4:
-        # Tous sélectionnés = pas de filtre
-        pass
-    else:
-        # Filtrer selon les sélections
-        if 'Mortels' not in gravite_options:
-            df_filtered = df_filtered[df_filtered.get('accident_mortel', 0) == 0]
-        
-        if 'Blessés graves' not in gravite_options:
-            df_filtered = df_filtered[df_filtered.get('nb_blesses_hospitalises', 0) == 0]
-        
-        if 'Blessés légers' not in gravite_options:
-            df_filtered = df_filtered[df_filtered.get('nb_blesses_legers', 0) == 0]
+    # Filtre géographique
+    st.sidebar.subheader("📍 Départements")
+    
+    departements = st.sidebar.multiselect(
+        "Départements (vide = toute la France)",
+        options=departements_dispo,
+        default=[],
+        key='departements_filter'
+    )
+    
+    # Barème de gravité : appliqué aux données filtrées, sans rechargement
+    bareme = severity_scale_sidebar()
+    
+    # Stockage partitionné : seules les partitions couvertes par les filtres sont lues
+    if df is None:
+        with st.spinner("⏳ Chargement des partitions..."), perf_block("partitions") as mesure:
+            fichiers = select_partitions(manifeste, date_range, departements)
+            df = load_partitions(version, tuple(fichiers))
+            mesure.update(fichiers=len(fichiers), lignes_sortie=len(df))
+        cle_index_spatial = (version, tuple(fichiers))
+        if df.empty:
+            st.warning("Aucune donnée pour la période et les départements sélectionnés")
+            return
+    
+    with perf_block("apply_filters", entree=df) as mesure:
+        df_filtered = apply_filters(df, date_range, gravite_options, departements)
+        mesure['lignes_sortie'] = len(df_filtered)
+    
+    with perf_block("apply_severity_scale", entree=df_filtered):
+        df_filtered = apply_severity_scale(df_filtered, bareme)
+
+    # État des filtres : avec la version des données, il identifie les cartes mises en cache
+    filtres = make_filter_state(date_range, gravite_options, departements)
+    set_run_context(version, filtres)
+    if apercu is None and st.session_state.get('dernier_etat_filtres') != filtres:
+        st.session_state['dernier_etat_filtres'] = filtres
+        log_filter_state(filtres)
+    
+    # Aperçu : KPI approximatifs, puis nouvelle exécution dès que la base complète est prête
+    if apercu is not None:
+        st.sidebar.markdown("---")
+        st.sidebar.subheader("📊 Données filtrées")
+        st.sidebar.metric("Accidents analysés", f"≈ {df_filtered['poids'].sum():,.0f}")
+        display_sample_preview(df_filtered)
+        with st.spinner("⏳ Calcul des résultats exacts..."):
+            job.result()
+        st.rerun()
+    
+    # Table temporelle de base : une seule agrégation par état des filtres
+    with perf_block("get_temporal_cube", entree=df_filtered, cache=True) as mesure:
+        cube = get_temporal_cube((version, filtres, bareme), df_filtered)
+        mesure['lignes_sortie'] = len(cube)
 
     # Statistiques après filtrage
     st.sidebar.markdown("---")
@@ -1060,10 +3241,26 @@ def main():
     if 'nb_tues' in df_filtered.columns:
         st.sidebar.metric("Décès totaux", f"{int(df_filtered['nb_tues'].sum()):,}")
     
+    # Rapport mémoire (mode debug)
+    if is_debug_mode():
+        rapport = memory_report(df)
+        with st.sidebar.expander("🧠 Mémoire (debug)"):
+            memoire_brute = df.attrs.get('memoire_brute')
+            st.metric(
+                "DataFrame chargé",
+                f"{rapport['Mo'].sum():.1f} Mo",
+                f"{rapport['Mo'].sum() - memoire_brute / 1e6:+.1f} Mo vs brut" if memoire_brute else None,
+                delta_color="inverse"
+            )
+            st.dataframe(rapport.round(2), use_container_width=True)
+    
     # ========================================================================
     # CONTENU PRINCIPAL - NARRATION EN 6 ACTES
     # ========================================================================
     
+    # Plotly Express n'est chargé qu'ici : l'aperçu et le démarrage du worker s'en passent
+    import plotly.express as px
+    
     # Création des tabs pour la navigation narrative
     tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "📊 Vue d'ensemble",
@@ -1132,8 +3329,25 @@ def main():
         
         # Graphique principal - Timeline
         st.markdown("### 📈 Évolution dans le temps")
-        fig_timeline = create_time_series_chart(df_filtered)
-        st.plotly_chart(fig_timeline, use_container_width=True)
+        granularites = {"Automatique": None, "Jour": 'D', "Semaine": 'W-MON', "Mois": 'MS'}
+        col_gran, col_lttb = st.columns([2, 3])
+        with col_gran:
+            granularite = st.selectbox(
+                "Granularité",
+                options=list(granularites.keys()),
+                key='timeseries_granularite'
+            )
+        with col_lttb:
+            lttb_actif = st.checkbox(
+                "⚡ Sous-échantillonner les courbes (LTTB, 1 000 points max.)",
+                value=True,
+                key='timeseries_lttb'
+            )
+        with perf_block("create_time_series_chart", entree=cube):
+            fig_timeline = create_time_series_chart(
+                cube, downsample=lttb_actif, freq=granularites[granularite]
+            )
+        show_chart(fig_timeline, use_container_width=True)
         
         # Insight principal
         st.markdown('<div class="insight-box">', unsafe_allow_html=True)
@@ -1165,35 +3379,48 @@ def main():
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Analyse mensuelle
-        if 'mois' in df_filtered.columns:
+        if not cube.empty:
             st.markdown("### 📅 Évolution mensuelle")
-            fig_monthly = create_monthly_analysis(df_filtered)
-            st.plotly_chart(fig_monthly, use_container_width=True)
+            with perf_block("create_monthly_analysis", entree=cube):
+                fig_monthly = create_monthly_analysis(cube)
+            show_chart(fig_monthly, use_container_width=True)
         
         col1, col2 = st.columns(2)
         
         with col1:
             # Analyse saisonnière
-            if 'saison' in df_filtered.columns:
-                fig_seasonal = create_seasonal_analysis(df_filtered)
-                st.plotly_chart(fig_seasonal, use_container_width=True)
+            if not cube.empty:
+                with perf_block("create_seasonal_analysis", entree=cube):
+                    fig_seasonal = create_seasonal_analysis(cube)
+                show_chart(fig_seasonal, use_container_width=True)
         
         with col2:
             # Analyse par jour de semaine
-            if 'jour_semaine' in df_filtered.columns:
-                fig_weekday = create_weekday_analysis(df_filtered)
-                st.plotly_chart(fig_weekday, use_container_width=True)
+            if not cube.empty:
+                with perf_block("create_weekday_analysis", entree=cube):
+                    fig_weekday = create_weekday_analysis(cube)
+                show_chart(fig_weekday, use_container_width=True)
+        
+        # Heatmap heure x jour de la semaine
+        with perf_block("get_hour_weekday_matrix", entree=df_filtered, cache=True):
+            matrice_heures = get_hour_weekday_matrix((version, filtres, bareme), df_filtered)
+        if matrice_heures is not None:
+            st.markdown("### 🕐 Heures et jours à risque")
+            vue_heatmap = st.selectbox(
+                "Indicateur affiché",
+                options=["Gravité moyenne (tous accidents)"] + CATEGORIES_GRAVITE,
+                key='heatmap_heure_vue'
+            )
+            categorie_heatmap = None if vue_heatmap.startswith("Gravité moyenne") else vue_heatmap
+            with perf_block("create_heatmap_hour_day"):
+                fig_heures = create_heatmap_hour_day(matrice_heures, categorie=categorie_heatmap)
+            show_chart(fig_heures, use_container_width=True)
         
         # Weekend vs Semaine - version améliorée
-        if 'est_weekend' in df_filtered.columns:
+        if not cube.empty:
             st.markdown("### 🗓️ Comparaison Semaine vs Weekend")
             
-            weekend_stats = df_filtered.groupby('est_weekend').agg({
-                'Num_Acc': 'count',
-                'nb_tues': 'sum',
-                'nb_blesses_hospitalises': 'sum',
-                'score_gravite': 'mean'
-            }).reset_index()
+            weekend_stats = rollup_temporal(cube, 'est_weekend')
             weekend_stats['Période'] = weekend_stats['est_weekend'].map({0: 'Semaine', 1: 'Weekend'})
             
             col1, col2, col3 = st.columns(3)
@@ -1206,7 +3433,7 @@ def main():
                     title="Répartition des accidents",
                     color_discrete_map={'Semaine': '#3498db', 'Weekend': '#e74c3c'}
                 )
-                st.plotly_chart(fig_pie, use_container_width=True)
+                show_chart(fig_pie, use_container_width=True)
             
             with col2:
                 fig_bar = px.bar(
@@ -1219,7 +3446,7 @@ def main():
                     color_discrete_map={'Semaine': '#3498db', 'Weekend': '#e74c3c'}
                 )
                 fig_bar.update_traces(textposition='outside')
-                st.plotly_chart(fig_bar, use_container_width=True)
+                show_chart(fig_bar, use_container_width=True)
             
             with col3:
                 fig_gravite = px.bar(
@@ -1232,13 +3459,13 @@ def main():
                     color_discrete_map={'Semaine': '#3498db', 'Weekend': '#e74c3c'}
                 )
                 fig_gravite.update_traces(texttemplate='%{text:.1f}', textposition='outside')
-                st.plotly_chart(fig_gravite, use_container_width=True)
+                show_chart(fig_gravite, use_container_width=True)
         
         # Insight temporel
         st.markdown('<div class="insight-box">', unsafe_allow_html=True)
         
-        if 'mois' in df_filtered.columns and len(df_filtered) > 0:
-            monthly_deaths = df_filtered.groupby('mois')['nb_tues'].sum()
+        if not cube.empty:
+            monthly_deaths = cube.groupby('mois')['nb_tues'].sum()
             
             # Vérifier qu'il y a des données avant d'appeler idxmax()
             if len(monthly_deaths) > 0 and monthly_deaths.sum() > 0:
@@ -1319,7 +3546,7 @@ def main():
             else:
                 st.info("💡 **Zone rouge** = Concentration élevée d'accidents | **Zone jaune/bleue** = Concentration faible")
                 
-                col1, col2, col3, col4 = st.columns(4)
+                col1, col2, col3 = st.columns(3)
                 
                 with col1:
                     st.metric(
@@ -1349,35 +3576,37 @@ def main():
                     else:
                         st.metric("⚠️ Gravité moyenne", "N/A")
                 
-                with col4:
-                    # Bouton de rafraîchissement avec rerun
-                    if st.button("🔄 Actualiser la carte", key="refresh_heatmap"):
-                        st.session_state.map_counter = st.session_state.get('map_counter', 0) + 1
-                        st.rerun()
-                
                 st.markdown("---")
                 
-                # Message d'info sur le rafraîchissement
-                st.info("💡 **Astuce :** Si la carte ne s'affiche pas correctement après un changement de filtres, cliquez sur '🔄 Actualiser la carte'")
-                
-                # Générer et afficher la carte
+                # Choix du mode de rendu de la heatmap
+                modes_heatmap = {
+                    "🧮 Grille pondérée (tous les accidents)": 'grille',
+                    "🖼️ Raster de densité (image unique)": 'raster',
+                    f"📍 Points (échantillon stratifié, {POINTS_BUDGET} max.)": 'points'
+                }
+                mode_label = st.radio(
+                    "Mode d'affichage de la carte de chaleur",
+                    options=list(modes_heatmap.keys()),
+                    horizontal=True,
+                    key='heatmap_mode'
+                )
+
+                # Générer et afficher la carte (HTML en cache par version des données + filtres)
                 with st.spinner("🗺️ Génération de la carte..."):
-                    france_map = create_france_map(df_filtered)
+                    params_map = (('mode', modes_heatmap[mode_label]),)
+                    map_key = make_map_key('heatmap', version, filtres, params_map, bareme)
+                    with perf_block(f"create_france_map · {params_map[0][1]}", entree=df_filtered, cache=True):
+                        france_map_html = render_map_html(map_key, create_france_map, df_filtered, params_map)
                     
-                    if france_map is not None:
+                    if france_map_html is not None:
                         try:
-                            # SOLUTION ROBUSTE : Utiliser UUID au lieu de hash
-                            unique_id = str(uuid.uuid4())[:8]
-                            map_key = f"heatmap_{unique_id}_{st.session_state.get('map_counter', 0)}"
-                            
-                            # Afficher avec la clé unique
-                            st_folium(france_map, width=1000, height=600, returned_objects=[], key=map_key)
+                            display_map(france_map_html, height=600)
                             
                             # Légende explicative
                             st.markdown("""
                             <div style='background: #f8f9fa; padding: 15px; border-radius: 10px; margin-top: 10px;'>
                             <b>🔍 Lecture de la carte :</b><br>
-                            • <span style='color: red;'>⬤ Points rouges</span> : Accidents mortels (100 plus récents)<br>
+                            • <span style='color: red;'>⬤ Points rouges</span> : Accidents mortels (tous, regroupés par zone au dézoom)<br>
                             • <span style='color: red;'>🔥 Zones rouges</span> : Forte concentration d'accidents<br>
                             • <span style='color: orange;'>🟠 Zones orange</span> : Concentration moyenne<br>
                             • <span style='color: blue;'>🔵 Zones bleues</span> : Faible concentration
@@ -1385,28 +3614,79 @@ def main():
                             """, unsafe_allow_html=True)
                         except Exception as e:
                             st.error(f"⚠️ Erreur lors de l'affichage de la carte : {str(e)}")
-                            st.warning("💡 Cliquez sur le bouton '🔄 Actualiser la carte' ci-dessus pour réessayer")
                     else:
                         st.warning("⚠️ Impossible de générer la carte avec les données disponibles")
         
         # Analyse par département
         if 'dep' in df_filtered.columns:
             st.markdown("### 📊 Analyse départementale")
-            fig_dept = create_department_analysis(df_filtered)
+            with perf_block("get_geo_hierarchy", entree=df_filtered, cache=True):
+                hierarchie = get_geo_hierarchy((version, filtres, bareme), df_filtered)
+            dept_stats = hierarchie['departements'] if hierarchie is not None else pd.DataFrame()
+            
+            geojson_url = prepare_department_geometry(get_dataset_version(DEPARTEMENTS_GEOJSON))
+            if geojson_url is not None:
+                mesure_dept = st.radio(
+                    "Mesure affichée",
+                    options=['Décès', 'Taux de mortalité', 'Gravité moyenne'],
+                    horizontal=True,
+                    key='choroplethe_mesure'
+                )
+                with perf_block("create_department_choropleth", entree=dept_stats):
+                    fig_choro = create_department_choropleth(dept_stats, mesure_dept, geojson_url)
+                if fig_choro.data:
+                    show_chart(fig_choro, use_container_width=True)
+            else:
+                st.info(f"💡 Ajoutez les contours des départements ({DEPARTEMENTS_GEOJSON}) pour afficher la carte choroplèthe")
+            
+            with perf_block("create_department_analysis", entree=dept_stats):
+                fig_dept = create_department_analysis(dept_stats)
             if fig_dept.data:
-                st.plotly_chart(fig_dept, use_container_width=True)
+                show_chart(fig_dept, use_container_width=True)
             else:
                 st.warning("Pas de données départementales à afficher")
+            
+            # Exploration hiérarchique : cliquer une barre descend d'un niveau
+            if hierarchie is not None:
+                st.markdown("### 🧭 Région → Département → Commune")
+                st.caption("Cliquez sur une région, puis sur un département pour afficher ses communes")
+                
+                event_region = show_chart(
+                    create_geo_level_chart(hierarchie['regions'], 'Région'),
+                    use_container_width=True, on_select='rerun', selection_mode='points',
+                    key='drill_region'
+                )
+                region = _selected_label(event_region)
+                
+                if region in hierarchie['departements_par_region']:
+                    st.markdown(f"#### {region}")
+                    event_dep = show_chart(
+                        create_geo_level_chart(hierarchie['departements_par_region'][region], 'Département'),
+                        use_container_width=True, on_select='rerun', selection_mode='points',
+                        key=f"drill_dep_{region}"
+                    )
+                    departement = _selected_label(event_dep)
+                    
+                    if departement in hierarchie['communes_par_departement']:
+                        communes = hierarchie['communes_par_departement'][departement]
+                        st.markdown(f"#### Département {departement} — {len(communes)} communes")
+                        st.dataframe(
+                            communes.nlargest(50, 'Accidents')[
+                                ['Commune', 'Accidents', 'Décès', 'Blessés graves', 'Gravité moyenne', 'Taux de mortalité']
+                            ].round(1),
+                            use_container_width=True, hide_index=True
+                        )
         
         # Types de routes
         if 'catr_desc' in df_filtered.columns:
             st.markdown("### 🛣️ Dangerosité par type de route")
             
-            route_stats = df_filtered.groupby('catr_desc').agg({
-                'Num_Acc': 'count',
-                'nb_tues': 'sum',
-                'score_gravite': 'mean'
-            }).reset_index()
+            with perf_block("query_group_stats · catr_desc", entree=df_filtered):
+                route_stats = query_group_stats(df_filtered, 'catr_desc', {
+                    'Num_Acc': 'count',
+                    'nb_tues': 'sum',
+                    'score_gravite': 'mean'
+                })
             
             # Vérifier qu'il y a des données
             if len(route_stats) > 0:
@@ -1422,7 +3702,7 @@ def main():
                     color_continuous_scale='RdYlGn_r',
                     title="Types de routes : Volume vs Dangerosité"
                 )
-                st.plotly_chart(fig_routes, use_container_width=True)
+                show_chart(fig_routes, use_container_width=True)
             else:
                 st.info("💡 Aucune donnée sur les types de routes pour les filtres sélectionnés")
         
@@ -1455,27 +3735,29 @@ def main():
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Analyse météo et luminosité
-        fig_meteo, fig_lum = create_risk_factors_analysis(df_filtered)
+        with perf_block("create_risk_factors_analysis", entree=df_filtered):
+            fig_meteo, fig_lum = create_risk_factors_analysis(df_filtered)
         
         col1, col2 = st.columns(2)
         
         with col1:
             if fig_meteo:
-                st.plotly_chart(fig_meteo, use_container_width=True)
+                show_chart(fig_meteo, use_container_width=True)
         
         with col2:
             if fig_lum:
-                st.plotly_chart(fig_lum, use_container_width=True)
+                show_chart(fig_lum, use_container_width=True)
         
         # État de la route
         if 'surf_desc' in df_filtered.columns:
             st.markdown("### 🛣️ Impact de l'état de la route")
             
-            surface_stats = df_filtered.groupby('surf_desc').agg({
-                'accident_mortel': 'mean',
-                'Num_Acc': 'count',
-                'score_gravite': 'mean'
-            }).reset_index()
+            with perf_block("query_group_stats · surf_desc", entree=df_filtered):
+                surface_stats = query_group_stats(df_filtered, 'surf_desc', {
+                    'accident_mortel': 'mean',
+                    'Num_Acc': 'count',
+                    'score_gravite': 'mean'
+                })
             surface_stats.columns = ['État', 'Taux mortalité', 'Nombre', 'Gravité']
             surface_stats['Taux mortalité'] = surface_stats['Taux mortalité'] * 100
             
@@ -1490,7 +3772,7 @@ def main():
                 color_continuous_scale='RdYlGn_r',
                 labels={'Gravité': 'Score de gravité moyen', 'État': 'État de la route'}
             )
-            st.plotly_chart(fig_surface, use_container_width=True)
+            show_chart(fig_surface, use_container_width=True)
         
         # Cocktail mortel
         st.markdown('<div class="danger-alert">', unsafe_allow_html=True)
@@ -1527,63 +3809,231 @@ def main():
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Analyse de concentration géographique - CARTE INTERACTIVE
-        st.markdown("### 🔥 Top 20 Points Noirs - Carte Interactive")
+        st.markdown("### 🔥 Top Points Noirs - Carte Interactive")
         
-        col_info, col_btn = st.columns([4, 1])
-        with col_info:
-            st.info("🔍 **Cliquez sur les marqueurs** pour voir les détails de chaque point noir. La taille des cercles est proportionnelle au nombre d'accidents.")
-        with col_btn:
-            if st.button("🔄 Actualiser", key="refresh_hotspots"):
-                st.session_state.map_counter = st.session_state.get('map_counter', 0) + 1
-                st.rerun()
+        st.info("🔍 **Cliquez sur les marqueurs** pour voir les détails de chaque point noir. La taille des cercles est proportionnelle au nombre d'accidents.")
+        
+        # Paramètres du regroupement spatial
+        col_rayon, col_min, col_top = st.columns(3)
+        with col_rayon:
+            rayon_hotspot = st.slider(
+                "📏 Rayon de regroupement (m)",
+                min_value=50, max_value=1000, value=HOTSPOT_RAYON_M, step=50,
+                key='hotspot_rayon'
+            )
+        with col_min:
+            min_hotspot = st.slider(
+                "🔢 Accidents minimum par point noir",
+                min_value=2, max_value=20, value=HOTSPOT_MIN_ACCIDENTS,
+                key='hotspot_min'
+            )
+        with col_top:
+            top_hotspot = st.select_slider(
+                "🏆 Nombre de points noirs affichés",
+                options=[20, 50, 100, 500, 1000, 2000, 5000],
+                value=HOTSPOT_TOP_DEFAUT,
+                key='hotspot_top'
+            )
         
-        hotspots_map = create_accident_concentration_analysis(df_filtered)
+        # Carte en cache : reconstruite uniquement si données, filtres ou paramètres changent
+        params_hotspots = (('rayon_m', rayon_hotspot), ('min_accidents', min_hotspot), ('top_n', top_hotspot),
+                           ('seuils', bareme[1]))
+        hotspots_key = make_map_key('hotspots', version, filtres, params_hotspots, bareme)
+        with perf_block("create_accident_concentration_analysis", entree=df_filtered, cache=True):
+            hotspots_html = render_map_html(
+                hotspots_key, create_accident_concentration_analysis, df_filtered, params_hotspots
+            )
         
-        if hotspots_map:
+        if hotspots_html:
             try:
-                # SOLUTION ROBUSTE : Utiliser UUID au lieu de hash complexe
-                unique_id = str(uuid.uuid4())[:8]
-                hotspots_key = f"hotspots_{unique_id}_{st.session_state.get('map_counter', 0)}"
-                
-                # Afficher avec la clé unique
-                st_folium(hotspots_map, width=1000, height=600, returned_objects=[], key=hotspots_key)
+                display_map(hotspots_html, height=600)
             except Exception as e:
                 st.error(f"⚠️ Erreur lors de l'affichage de la carte : {str(e)}")
-                st.warning("💡 Cliquez sur le bouton '🔄 Actualiser' ci-dessus pour réessayer")
         else:
             st.warning("⚠️ Données de localisation GPS insuffisantes pour afficher la carte des points noirs")
             st.info("💡 Assurez-vous que votre dataset contient les colonnes 'lat' et 'long' avec des valeurs valides")
         
+        # Surface de risque lissée (KDE par convolution FFT, mise en cache par état des filtres)
+        if {'lat', 'long'} <= set(df_filtered.columns) and len(df_filtered) > 0:
+            st.markdown("### 🌡️ Surface de risque")
+            st.caption("Densité lissée des accidents filtrés par km², pondérée par la gravité ou les décès")
+            
+            col_poids, col_bande, col_noyau = st.columns(3)
+            with col_poids:
+                libelle_poids = st.radio(
+                    "Pondération", options=list(KDE_PONDERATIONS),
+                    horizontal=True, key='kde_ponderation'
+                )
+            with col_bande:
+                bande_kde = st.slider(
+                    "📏 Bande passante (m)", min_value=500, max_value=20000,
+                    value=KDE_BANDE_DEFAUT_M, step=500, key='kde_bande'
+                )
+            with col_noyau:
+                libelle_noyau = st.selectbox("Noyau", options=list(KDE_NOYAUX), key='kde_noyau')
+            
+            ponderation_kde = KDE_PONDERATIONS[libelle_poids]
+            noyau_kde = KDE_NOYAUX[libelle_noyau]
+            params_kde = (('ponderation', ponderation_kde), ('bande_m', bande_kde), ('noyau', noyau_kde))
+            with perf_block("compute_kde_surface", entree=df_filtered, cache=True):
+                surface = get_kde_surface((version, filtres, bareme), df_filtered, ponderation_kde, bande_kde, noyau_kde)
+                kde_html = render_map_html(
+                    make_map_key('kde', version, filtres, params_kde, bareme), create_kde_map, surface, ()
+                )
+            display_map(kde_html, height=550)
+            
+            densite_kde = surface['densite']
+            unite = {'score_gravite': 'points de gravité', 'nb_tues': 'décès'}.get(ponderation_kde, 'accidents')
+            st.caption(
+                f"Grille {densite_kde.shape[1]}×{densite_kde.shape[0]} (maille ≈ {surface['cellule_m']} m) · "
+                f"densité maximale {densite_kde.max():,.2f} {unite}/km²"
+            )
+            
+            nom_export = f"surface_risque_{surface['ponderation']}_{noyau_kde}_{bande_kde}m"
+            with perf_block("get_kde_exports", cache=True):
+                export_png, export_npz = get_kde_exports(
+                    (version, filtres, bareme), ponderation_kde, bande_kde, noyau_kde, surface
+                )
+            col_png, col_npz = st.columns(2)
+            with col_png:
+                st.download_button(
+                    "🖼️ Exporter l'image (PNG, Web Mercator)",
+                    data=export_png, file_name=f"{nom_export}.png",
+                    mime='image/png', key='kde_export_png'
+                )
+            with col_npz:
+                st.download_button(
+                    "📦 Exporter la grille (NumPy .npz)",
+                    data=export_npz, file_name=f"{nom_export}.npz",
+                    mime='application/octet-stream', key='kde_export_npz'
+                )
+        
+        # Recherche autour d'un point cliqué (index spatial construit une fois par version)
+        if {'lat', 'long'} <= set(df.columns) and len(df_filtered) > 0:
+            import folium
+            from streamlit_folium import st_folium
+            
+            st.markdown("### 📍 Accidents autour d'un point")
+            st.caption("Cliquez sur la carte : accidents dans un rayon ou plus proches voisins, parmi les accidents filtrés")
+            
+            col_mode, col_param = st.columns(2)
+            with col_mode:
+                mode_recherche = st.radio(
+                    "Type de recherche",
+                    options=["Dans un rayon", "Plus proches voisins"],
+                    horizontal=True,
+                    key='recherche_mode'
+                )
+            with col_param:
+                if mode_recherche == "Dans un rayon":
+                    rayon_recherche = st.slider(
+                        "📏 Rayon (m)", min_value=50, max_value=5000,
+                        value=RECHERCHE_RAYON_DEFAUT, step=50, key='recherche_rayon'
+                    )
+                else:
+                    rayon_recherche = None
+                    k_recherche = st.slider(
+                        "🔢 Nombre d'accidents", min_value=1, max_value=200,
+                        value=RECHERCHE_K_DEFAUT, key='recherche_k'
+                    )
+            
+            point = st.session_state.get('recherche_point')
+            positions = distances = np.empty(0, dtype=np.int64)
+            if point is not None:
+                with perf_block("recherche spatiale", entree=df, cache=True) as mesure:
+                    index_spatial = get_spatial_index(cle_index_spatial, df)
+                    masque = df.index.isin(df_filtered.index)
+                    if rayon_recherche is not None:
+                        positions, distances = query_radius(index_spatial, *point, rayon_recherche, masque)
+                    else:
+                        positions, distances = query_nearest(index_spatial, *point, k_recherche, masque)
+                    mesure['lignes_sortie'] = len(positions)
+            
+            # Fond de carte fixe (son état est conservé), résultats ajoutés en calque dynamique
+            carte_recherche = folium.Map(
+                location=FRANCE_CENTRE, zoom_start=ZOOM_FRANCE,
+                tiles='OpenStreetMap', prefer_canvas=True
+            )
+            st_folium(
+                carte_recherche,
+                key='recherche_carte',
+                height=450,
+                use_container_width=True,
+                returned_objects=['last_clicked'],
+                feature_group_to_add=(build_search_layer(df, positions, point, rayon_recherche)
+                                      if point is not None else None),
+                center=point,
+                on_change=_store_search_point
+            )
+            
+            if point is not None:
+                resultats = apply_severity_scale(df.iloc[positions], bareme)
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("🚨 Accidents trouvés", f"{len(positions):,}")
+                with col2:
+                    st.metric("💀 Décès", f"{int(resultats['nb_tues'].sum()) if 'nb_tues' in resultats.columns else 0:,}")
+                with col3:
+                    st.metric("🏥 Blessés graves",
+                              f"{int(resultats['nb_blesses_hospitalises'].sum()) if 'nb_blesses_hospitalises' in resultats.columns else 0:,}")
+                with col4:
+                    st.metric("📏 Plus éloigné", f"{distances[-1]:,.0f} m" if len(distances) else "-")
+                
+                if len(positions) > 0:
+                    if 'categorie_gravite' in resultats.columns:
+                        repartition = (resultats['categorie_gravite'].value_counts()
+                                       .reindex(CATEGORIES_GRAVITE, fill_value=0))
+                        st.caption("Répartition par gravité : " + " · ".join(
+                            f"{categorie} {nombre}" for categorie, nombre in repartition.items()
+                        ))
+                    
+                    # Tableau paginé (le tableau complet n'est jamais construit)
+                    nb_pages = int(np.ceil(len(positions) / RECHERCHE_PAGE))
+                    page = st.number_input(
+                        f"Page (sur {nb_pages})", min_value=1, max_value=nb_pages, value=1,
+                        key=f"recherche_page_{len(positions)}"
+                    ) if nb_pages > 1 else 1
+                    tranche = slice((page - 1) * RECHERCHE_PAGE, page * RECHERCHE_PAGE)
+                    st.dataframe(
+                        search_results_table(df, positions[tranche], distances[tranche], bareme),
+                        use_container_width=True, hide_index=True
+                    )
+                else:
+                    st.info("Aucun accident filtré dans ce périmètre")
+        
         # Types de collision
         if 'col_desc' in df_filtered.columns:
             st.markdown("### 💥 Analyse des types de collision")
-            fig_collision = create_collision_type_analysis(df_filtered)
+            with perf_block("create_collision_type_analysis", entree=df_filtered):
+                fig_collision = create_collision_type_analysis(df_filtered)
             if fig_collision.data:
-                st.plotly_chart(fig_collision, use_container_width=True)
+                show_chart(fig_collision, use_container_width=True)
         
         # Infrastructure
         st.markdown("### 🏗️ Impact de l'infrastructure routière")
-        fig_profile, fig_plan = create_infrastructure_analysis(df_filtered)
+        with perf_block("create_infrastructure_analysis", entree=df_filtered):
+            fig_profile, fig_plan = create_infrastructure_analysis(df_filtered)
         
         col1, col2 = st.columns(2)
         
         with col1:
             if fig_profile.data:
-                st.plotly_chart(fig_profile, use_container_width=True)
+                show_chart(fig_profile, use_container_width=True)
         
         with col2:
             if fig_plan.data:
-                st.plotly_chart(fig_plan, use_container_width=True)
+                show_chart(fig_plan, use_container_width=True)
         
         # Intersection vs Section courante
         if 'circ_desc' in df_filtered.columns:
             st.markdown("### 🚦 Intersections vs Routes")
             
-            circ_stats = df_filtered.groupby('circ_desc').agg({
-                'Num_Acc': 'count',
-                'nb_tues': 'sum',
-                'score_gravite': 'mean'
-            }).reset_index()
+            with perf_block("query_group_stats · circ_desc", entree=df_filtered):
+                circ_stats = query_group_stats(df_filtered, 'circ_desc', {
+                    'Num_Acc': 'count',
+                    'nb_tues': 'sum',
+                    'score_gravite': 'mean'
+                })
             circ_stats.columns = ['Type', 'Accidents', 'Décès', 'Gravité']
             
             col1, col2, col3 = st.columns(3)
@@ -1596,7 +4046,7 @@ def main():
                     title="Répartition des accidents",
                     color_discrete_sequence=px.colors.sequential.RdBu
                 )
-                st.plotly_chart(fig_circ_pie, use_container_width=True)
+                show_chart(fig_circ_pie, use_container_width=True)
             
             with col2:
                 fig_circ_bar = px.bar(
@@ -1609,7 +4059,7 @@ def main():
                     text='Décès'
                 )
                 fig_circ_bar.update_traces(textposition='outside')
-                st.plotly_chart(fig_circ_bar, use_container_width=True)
+                show_chart(fig_circ_bar, use_container_width=True)
             
             with col3:
                 fig_circ_grav = px.bar(
@@ -1622,7 +4072,7 @@ def main():
                     text='Gravité'
                 )
                 fig_circ_grav.update_traces(texttemplate='%{text:.1f}', textposition='outside')
-                st.plotly_chart(fig_circ_grav, use_container_width=True)
+                show_chart(fig_circ_grav, use_container_width=True)
         
         # Insights sur les points noirs
         st.markdown('<div class="insight-box">', unsafe_allow_html=True)
@@ -1733,7 +4183,7 @@ def main():
         
         fig_matrix.update_traces(textposition='top center', textfont_size=9)
         fig_matrix.update_layout(height=600)
-        st.plotly_chart(fig_matrix, use_container_width=True)
+        show_chart(fig_matrix, use_container_width=True)
         
         # Top 3 recommandations
         st.markdown("### 🏆 Top 3 Actions Prioritaires")
@@ -1846,7 +4296,7 @@ def main():
             font=dict(size=14, color="#27ae60")
         )
         
-        st.plotly_chart(fig_projection, use_container_width=True)
+        show_chart(fig_projection, use_container_width=True)
         
         # Call to action final
         st.markdown('<div class="story-card" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-align: center; padding: 40px; border-radius: 20px; margin-top: 30px;">', unsafe_allow_html=True)
@@ -1893,10 +4343,17 @@ def main():
     📅 <b>Date :</b> 2024
     </div>
     """, unsafe_allow_html=True)
+    
+    # Chronométrage des blocs du rerun (mode debug)
+    display_perf_panel(version, filtres)
 
 # ============================================================================
 # POINT D'ENTRÉE
 # ============================================================================
 
 if __name__ == "__main__":
-    main()
+    if profile_target() == 'rerun':
+        with profiled('rerun'):
+            main()
+    else:
+        main()
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Benchmark du dashboard de sécurité routière
+Mesure le temps d'import de app.py (-X importtime), les constructeurs de graphiques
+(temps, mémoire, taille des figures) sur des datasets synthétiques de tailles croissantes,
+puis des sessions concurrentes du script complet via l'API de test de Streamlit
+(latence des reruns, mémoire par session), sur le CSV consolidé puis sur le stockage
+partitionné seul (lecture élaguée par les filtres).
+
+Usage :
+    python benchmark.py                                  # comparaison aux références
+    python benchmark.py --tailles 10000 100000 --sessions 8
+    python benchmark.py --update-baseline                # enregistre les références
+    python benchmark.py --tailles 5000000 --sessions 0   # grande taille, hors références
+"""
+
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime
+import pandas as pd
+import numpy as np
+import warnings
+warnings.filterwarnings('ignore')
+
+RACINE = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(RACINE, 'app.py')
+SAMPLE_FILE = os.path.join(RACINE, 'accidents_sample.csv')
+BASELINE_FILE = os.path.join(RACINE, 'benchmarks', 'baselines.json')
+
+# 5 M accidents (plusieurs années nationales) reste mesurable avec --tailles, mais hors
+# défauts : plusieurs minutes par exécution, pas de référence enregistrée
+TAILLES_DEFAUT = [10_000, 100_000, 1_000_000]
+REPETITIONS = 3           # meilleur temps sur n exécutions
+TOLERANCE_DEFAUT = 1.25   # régression si > 25 % au-dessus de la référence
+MARGE_BRUIT_S = 0.02      # marge absolue pour les mesures de quelques millisecondes
+
+# Modules de visualisation chargés à la demande : ils ne doivent pas l'être à l'import de app
+MODULES_DIFFERES = ['plotly.express', 'plotly.subplots', 'folium', 'streamlit_folium', 'duckdb',
+                    'pyarrow.dataset']
+IMPORTS_TOP = 10
+
+# Stockages des sessions concurrentes : clé des résultats -> mode de chargement de app
+STOCKAGES_SESSIONS = {'sessions': 'csv', 'sessions_partitions': 'partitions'}
+
+# Scénario d'une session : changements de filtres successifs (un rerun chacun)
+SCENARIO_SESSION = [
+    ('gravite', ['Mortels']),
+    ('gravite', ['Mortels', 'Blessés graves']),
+    ('periode', (date(2024, 3, 1), date(2024, 5, 31))),
+    ('heatmap', 1),
+    ('gravite', ['Mortels', 'Blessés graves', 'Blessés légers', 'Matériels']),
+    ('periode', (date(2024, 1, 1), date(2024, 12, 31))),
+]
+
+# ============================================================================
+# DONNÉES SYNTHÉTIQUES
+# ============================================================================
+
+def generate_synthetic_dataset(n, graine=0):
+    """
+    Dataset consolidé synthétique : ré-échantillonnage de l'échantillon réel avec
+    dates, heures et coordonnées perturbées (même schéma que Nettoyagedataset.py)
+    """
+    base = pd.read_csv(SAMPLE_FILE, low_memory=False)
+    rng = np.random.default_rng(graine)
+
+    df = base.sample(n, replace=True, random_state=graine).reset_index(drop=True)
+    df['Num_Acc'] = np.arange(n, dtype=np.int64) + 202400000000
+    df['lat'] = df['lat'] + rng.normal(0, 0.05, n)
+    df['long'] = df['long'] + rng.normal(0, 0.05, n)
+    jours = pd.to_datetime('2024-01-01') + pd.to_timedelta(rng.integers(0, 366, n), unit='D')
+    df['date'] = jours.strftime('%Y-%m-%d')
+    df['heure'] = rng.integers(0, 24, n)
+    return df
+
+def load_app():
+    """Importe app.py comme module (sans lancer main())"""
+    spec = importlib.util.spec_from_file_location('app_benchmark', APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# ============================================================================
+# MESURES
+# ============================================================================
+
+def rss_mo():
+    """Mémoire résidente du processus (Mo), 0 si indisponible"""
+    try:
+        with open('/proc/self/status') as f:
+            for ligne in f:
+                if ligne.startswith('VmRSS:'):
+                    return int(ligne.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def payload_size(resultat):
+    """Taille sérialisée (octets) d'une figure Plotly, d'une carte Folium ou d'un tuple de figures"""
+    if resultat is None:
+        return 0
+    if isinstance(resultat, (tuple, list)):
+        return sum(payload_size(r) for r in resultat)
+    if hasattr(resultat, 'get_root'):
+        return len(resultat.get_root().render())
+    if hasattr(resultat, 'to_plotly_json'):
+        return len(resultat.to_json())
+    return 0
+
+def measure(fonction, avec_memoire=True):
+    """Meilleur temps sur REPETITIONS exécutions, pic d'allocation (tracemalloc) et taille du résultat"""
+    secondes = float('inf')
+    for _ in range(REPETITIONS):
+        debut = time.perf_counter()
+        resultat = fonction()
+        secondes = min(secondes, time.perf_counter() - debut)
+
+    pic = None
+    if avec_memoire:
+        tracemalloc.start()
+        fonction()
+        pic = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+    return resultat, {
+        's': round(secondes, 4),
+        'pic_mo': round(pic, 2) if pic is not None else None,
+        'payload_ko': round(payload_size(resultat) / 1024, 1)
+    }
+
+def check_hotspot_stability(app, df, reference, decalage=0.5):
+    """Nombre de points noirs de `reference` retrouvés quand la grille est décalée
+
+    Déplacer tous les accidents de `decalage` x rayon (en mètres, vers le nord-est)
+    revient à décaler la grille de hachage d'autant : les points noirs doivent être
+    les mêmes, à la translation près (centres comparés à ~1 m).
+    """
+    rayon_terre = 6_371_000.0
+    dlat = np.degrees(decalage * app.HOTSPOT_RAYON_M / rayon_terre)
+    dlon = dlat / np.cos(np.radians(app.FRANCE_CENTRE[0]))
+    decales = app.compute_hotspots(df.assign(lat=df['lat'].astype(np.float64) + dlat,
+                                             long=df['long'].astype(np.float64) + dlon))
+
+    inchanges = 0
+    for _, point in reference.iterrows():
+        inchanges += bool((
+            (decales['Accidents'] == point['Accidents']) &
+            np.isclose(decales['Latitude'] - dlat, point['Latitude'], rtol=0, atol=1e-5) &
+            np.isclose(decales['Longitude'] - dlon, point['Longitude'], rtol=0, atol=1e-5)
+        ).any())
+    return inchanges
+
+def bench_builders(app, chemin_csv, avec_memoire=True):
+    """Mesure load_data, les agrégats et chaque constructeur create_* sur un fichier"""
+    mesures = {}
+
+    df, mesures['load_data'] = measure(lambda: app.load_data(chemin_csv), avec_memoire)
+    dates = (df['date'].min().date(), df['date'].max().date())
+    _, mesures['apply_filters'] = measure(
+        lambda: app.apply_filters(df, dates, ['Mortels', 'Blessés graves']), avec_memoire
+    )
+
+    cube, mesures['build_temporal_cube'] = measure(lambda: app.build_temporal_cube(df), avec_memoire)
+    matrice, mesures['compute_hour_weekday_matrix'] = measure(
+        lambda: app.compute_hour_weekday_matrix(df), avec_memoire
+    )
+    hierarchie, mesures['compute_geo_hierarchy'] = measure(
+        lambda: app.compute_geo_hierarchy(df), avec_memoire
+    )
+    surface, mesures['compute_kde_surface'] = measure(
+        lambda: app.compute_kde_surface(df), avec_memoire
+    )
+    hotspots, mesures['compute_hotspots'] = measure(lambda: app.compute_hotspots(df), avec_memoire)
+    inchanges = check_hotspot_stability(app, df, hotspots)
+    if inchanges < len(hotspots):
+        mesures['compute_hotspots'] = {
+            'erreur': f"{inchanges}/{len(hotspots)} points noirs inchangés après un décalage d'une demi-cellule"
+        }
+
+    constructeurs = {
+        'create_time_series_chart': lambda: app.create_time_series_chart(cube),
+        'create_monthly_analysis': lambda: app.create_monthly_analysis(cube),
+        'create_seasonal_analysis': lambda: app.create_seasonal_analysis(cube),
+        'create_weekday_analysis': lambda: app.create_weekday_analysis(cube),
+        'create_heatmap_hour_day': lambda: app.create_heatmap_hour_day(matrice),
+        'create_france_map[grille]': lambda: app.create_france_map(df, mode='grille'),
+        'create_france_map[raster]': lambda: app.create_france_map(df, mode='raster'),
+        'create_france_map[points]': lambda: app.create_france_map(df, mode='points'),
+        'create_geo_level_chart': lambda: app.create_geo_level_chart(hierarchie['regions'], 'Région'),
+        'create_department_analysis': lambda: app.create_department_analysis(hierarchie['departements']),
+        'create_department_choropleth': lambda: app.create_department_choropleth(
+            hierarchie['departements'], 'Décès', app.DEPARTEMENTS_URL
+        ),
+        'create_risk_factors_analysis': lambda: app.create_risk_factors_analysis(df),
+        'create_collision_type_analysis': lambda: app.create_collision_type_analysis(df),
+        'create_infrastructure_analysis': lambda: app.create_infrastructure_analysis(df),
+        'create_accident_concentration_analysis': lambda: app.create_accident_concentration_analysis(df),
+        'create_kde_map': lambda: app.create_kde_map(surface),
+    }
+    for nom, constructeur in constructeurs.items():
+        try:
+            _, mesures[nom] = measure(constructeur, avec_memoire)
+        except Exception as e:
+            mesures[nom] = {'erreur': f"{type(e).__name__}: {e}"}
+
+    return mesures
+
+def bench_imports(repetitions=REPETITIONS):
+    """
+    Temps d'import de app.py dans un processus neuf (-X importtime, meilleur de n),
+    imports directs les plus coûteux et modules différés chargés malgré tout
+    """
+    script = ("import json, sys; import app; "
+              f"print(json.dumps([m for m in {MODULES_DIFFERES!r} if m in sys.modules]))")
+    meilleur = None
+
+    for _ in range(repetitions):
+        sortie = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-B', '-c', script],
+            cwd=RACINE, capture_output=True, text=True
+        )
+        total_us, directs = 0, {}
+        for ligne in sortie.stderr.splitlines():
+            if not ligne.startswith('import time:') or 'cumulative' in ligne:
+                continue
+            _, cumul, nom = ligne.split('|')
+            if nom == ' app':
+                total_us = int(cumul)
+            elif nom.startswith('   ') and not nom.startswith('    '):
+                # Import direct de app (un niveau d'indentation sous « app »)
+                directs[nom.strip()] = int(cumul)
+        if meilleur is None or total_us < meilleur['total_ms'] * 1000:
+            charges = json.loads(sortie.stdout.strip().splitlines()[-1]) if sortie.stdout.strip() else []
+            top = sorted(directs.items(), key=lambda kv: -kv[1])[:IMPORTS_TOP]
+            meilleur = {
+                'total_ms': round(total_us / 1000, 1),
+                'imports_directs_ms': {nom: round(us / 1000, 1) for nom, us in top},
+                'modules_differes_charges': charges
+            }
+
+    return meilleur
+
+def write_session_data(app, dossier, df, stockage):
+    """
+    Écrit les données des sessions : CSV consolidé (base complète) ou partitions Parquet
+    seules, sans CSV, pour que app charge par partitions élaguées
+    """
+    os.makedirs(dossier)
+    if stockage == 'csv':
+        df.to_csv(os.path.join(dossier, app.DATA_FILE), index=False)
+    else:
+        from Nettoyagedataset import write_partitions
+        write_partitions(df, os.path.join(dossier, app.PARTITIONS_DIR))
+
+def _apply_step(at, etape, valeur):
+    """Applique une étape du scénario à une session AppTest"""
+    if etape == 'gravite':
+        at.multiselect[0].set_value(valeur)
+    elif etape == 'periode':
+        at.date_input(key='date_filter').set_value(valeur)
+    elif etape == 'heatmap':
+        radio = at.radio(key='heatmap_mode')
+        radio.set_value(radio.options[valeur])
+
+def bench_sessions(n_sessions, timeout=600):
+    """
+    Lance n sessions concurrentes du script complet (répertoire courant = données)
+    et mesure le premier rendu et chaque rerun du scénario
+    """
+    from unittest.mock import patch
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1 import AppTest
+
+    # AppTest recompile le script à chaque run ; la réécriture « magic » passe par
+    # ast.parse, qui n'est pas sûr entre threads en 3.11 (le script n'en a pas besoin)
+    config.set_option('runner.magicEnabled', False)
+
+    # AppTest installe un Runtime factice au début de chaque run et remet le singleton à
+    # None à la fin : entre sessions concurrentes, le premier run terminé l'efface sous les
+    # autres (« Runtime hasn't been created! »). Le dernier runtime installé reste servi
+    runtimes = []
+
+    def runtime_instance(cls):
+        if cls._instance is not None:
+            runtimes[:] = [cls._instance]
+        if not runtimes:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtimes[0]
+
+    def runtime_exists(cls):
+        return cls._instance is not None or bool(runtimes)
+
+    premiers, reruns, erreurs = [], [], []
+    verrou = threading.Lock()
+
+    def session():
+        at = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        try:
+            debut = time.perf_counter()
+            at.run()
+            with verrou:
+                premiers.append(time.perf_counter() - debut)
+                erreurs.extend(str(e.value) for e in at.exception)
+            for etape, valeur in SCENARIO_SESSION:
+                _apply_step(at, etape, valeur)
+                debut = time.perf_counter()
+                at.run()
+                with verrou:
+                    reruns.append(time.perf_counter() - debut)
+                    erreurs.extend(str(e.value) for e in at.exception)
+        except Exception as e:
+            with verrou:
+                erreurs.append(f"{type(e).__name__}: {e}")
+
+    gc.collect()
+    rss_avant = rss_mo()
+    threads = [threading.Thread(target=session) for _ in range(n_sessions)]
+    debut = time.perf_counter()
+    with patch.object(Runtime, 'instance', classmethod(runtime_instance)), \
+            patch.object(Runtime, 'exists', classmethod(runtime_exists)):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    return {
+        'sessions': n_sessions,
+        'duree_totale_s': round(time.perf_counter() - debut, 2),
+        'premier_rendu_p50_s': round(float(np.percentile(premiers, 50)), 3) if premiers else None,
+        'rerun_p50_s': round(float(np.percentile(reruns, 50)), 3) if reruns else None,
+        'rerun_p95_s': round(float(np.percentile(reruns, 95)), 3) if reruns else None,
+        'memoire_par_session_mo': round((rss_mo() - rss_avant) / max(n_sessions, 1), 1),
+        'erreurs': erreurs[:10]
+    }
+
+# ============================================================================
+# RÉFÉRENCES ET RAPPORT
+# ============================================================================
+
+def collect_errors(resultats):
+    """Erreurs de l'exécution : constructeurs en échec et exceptions des sessions"""
+    erreurs = [f"{nom} @ {int(taille):,} : {valeurs['erreur']}"
+               for taille, mesures in resultats.get('builders', {}).items()
+               for nom, valeurs in mesures.items() if 'erreur' in valeurs]
+    for cle in STOCKAGES_SESSIONS:
+        erreurs += [f"{cle} : {e}" for e in resultats.get(cle, {}).get('erreurs', [])]
+    return erreurs
+
+def compare_to_baseline(resultats, references, tolerance):
+    """Liste des mesures (temps, latences) dépassant la référence de plus de `tolerance` (+ marge de bruit)"""
+    regressions = []
+
+    for taille, mesures in resultats.get('builders', {}).items():
+        for nom, valeurs in mesures.items():
+            ref = references.get('builders', {}).get(taille, {}).get(nom, {})
+            if 's' in valeurs and 's' in ref and valeurs['s'] > ref['s'] * tolerance + MARGE_BRUIT_S:
+                regressions.append(f"{nom} @ {int(taille):,} : {valeurs['s']:.3f} s (référence {ref['s']:.3f} s)")
+
+    imports, ref_imports = resultats.get('imports', {}), references.get('imports', {})
+    if imports.get('total_ms') and ref_imports.get('total_ms') and \
+            imports['total_ms'] > ref_imports['total_ms'] * tolerance + MARGE_BRUIT_S * 1000:
+        regressions.append(f"import de app : {imports['total_ms']:.0f} ms (référence {ref_imports['total_ms']:.0f} ms)")
+    for module in imports.get('modules_differes_charges', []):
+        regressions.append(f"import de app : {module} chargé au démarrage")
+
+    for scenario in STOCKAGES_SESSIONS:
+        sessions, ref_sessions = resultats.get(scenario, {}), references.get(scenario, {})
+        for cle in ('rerun_p50_s', 'rerun_p95_s'):
+            if sessions.get(cle) and ref_sessions.get(cle) and sessions[cle] > ref_sessions[cle] * tolerance:
+                regressions.append(f"{scenario} {cle} : {sessions[cle]:.3f} s (référence {ref_sessions[cle]:.3f} s)")
+
+    return regressions
+
+def print_builders(taille, mesures):
+    """Tableau des mesures d'une taille de dataset"""
+    print(f"\n📊 {taille:,} accidents")
+    print(f"  {'Étape':<42}{'Temps (s)':>11}{'Pic (Mo)':>10}{'Payload (Ko)':>14}")
+    for nom, v in mesures.items():
+        if 'erreur' in v:
+            print(f"  {nom:<42}  ❌ {v['erreur']}")
+            continue
+        pic = f"{v['pic_mo']:.1f}" if v['pic_mo'] is not None else '-'
+        print(f"  {nom:<42}{v['s']:>11.3f}{pic:>10}{v['payload_ko']:>14.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du dashboard sécurité routière")
+    parser.add_argument('--tailles', type=int, nargs='+', default=TAILLES_DEFAUT,
+                        help="tailles des datasets synthétiques (nombre d'accidents)")
+    parser.add_argument('--sessions', type=int, default=4, help="sessions concurrentes (0 = aucune)")
+    parser.add_argument('--taille-sessions', type=int, default=100_000,
+                        help="taille du dataset des sessions concurrentes")
+    parser.add_argument('--sans-memoire', action='store_true', help="pas de passe tracemalloc")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE_DEFAUT)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true', help="enregistre les résultats comme références")
+    parser.add_argument('--sortie', help="fichier JSON des résultats")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK DU DASHBOARD")
+    print("=" * 60)
+
+    resultats = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpu': os.cpu_count()
+        },
+        'builders': {}
+    }
+
+    # Démarrage à froid : import de app.py dans un processus neuf
+    resultats['imports'] = bench_imports()
+    print(f"\n📦 Import de app.py : {resultats['imports']['total_ms']:.0f} ms")
+    for nom, ms in resultats['imports']['imports_directs_ms'].items():
+        print(f"  {nom:<42}{ms:>11.1f} ms")
+    if resultats['imports']['modules_differes_charges']:
+        print(f"  ⚠️ chargés au démarrage : {', '.join(resultats['imports']['modules_differes_charges'])}")
+
+    dossier = tempfile.mkdtemp(prefix='bench_accidents_')
+    dossier_initial = os.getcwd()
+    try:
+        app = load_app()
+
+        # Sessions concurrentes sur le script complet (données dans un répertoire dédié par
+        # stockage), mesurées en premier pour que l'écart de mémoire résidente ne dépende pas
+        # des gros datasets
+        if args.sessions > 0:
+            donnees_sessions = generate_synthetic_dataset(args.taille_sessions)
+            for scenario, stockage in STOCKAGES_SESSIONS.items():
+                if stockage == 'partitions' and importlib.util.find_spec('pyarrow') is None:
+                    print("\n⚠️ pyarrow absent : sessions sur partitions non mesurées")
+                    continue
+                dossier_sessions = os.path.join(dossier, scenario)
+                write_session_data(app, dossier_sessions, donnees_sessions, stockage)
+                os.chdir(dossier_sessions)
+                sessions = bench_sessions(args.sessions)
+                sessions['taille'] = args.taille_sessions
+                sessions['stockage'] = stockage
+                resultats[scenario] = sessions
+                print(f"\n👥 {args.sessions} sessions concurrentes sur {args.taille_sessions:,} accidents ({stockage})")
+                for cle, valeur in sessions.items():
+                    print(f"  {cle}: {valeur}")
+                os.chdir(dossier_initial)
+
+        # Constructeurs sur chaque taille de dataset, après un tour d'échauffement
+        # (imports paresseux, templates Plotly) qui fausserait la première taille
+        chemin = os.path.join(dossier, 'accidents_echauffement.csv')
+        generate_synthetic_dataset(1_000).to_csv(chemin, index=False)
+        bench_builders(app, chemin, avec_memoire=False)
+
+        for taille in args.tailles:
+            chemin = os.path.join(dossier, f'accidents_{taille}.csv')
+            generate_synthetic_dataset(taille).to_csv(chemin, index=False)
+            mesures = bench_builders(app, chemin, avec_memoire=not args.sans_memoire)
+            resultats['builders'][str(taille)] = mesures
+            print_builders(taille, mesures)
+    finally:
+        os.chdir(dossier_initial)
+        shutil.rmtree(dossier, ignore_errors=True)
+
+    if args.sortie:
+        with open(args.sortie, 'w', encoding='utf-8') as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=1)
+
+    # Une exécution en erreur n'est ni une référence ni un succès (des sessions
+    # interrompues tôt donneraient des latences artificiellement basses)
+    erreurs = collect_errors(resultats)
+    if erreurs:
+        print(f"\n❌ {len(erreurs)} erreur(s) pendant le benchmark :")
+        for e in erreurs:
+            print(f"  - {e}")
+        if args.update_baseline:
+            print("💾 Références non enregistrées")
+        return 1
+
+    # Références : enregistrement ou comparaison
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=1)
+        print(f"\n💾 Références enregistrées: {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            references = json.load(f)
+        regressions = compare_to_baseline(resultats, references, args.tolerance)
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} régression(s) au-delà de x{args.tolerance}:")
+            for r in regressions:
+                print(f"  - {r}")
+            return 1
+        print(f"\n✅ Aucune régression au-delà de x{args.tolerance} par rapport aux références")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Échantillon stratifié pondéré des accidents (aperçu immédiat du dashboard)
+
+Partagé par Nettoyagedataset.py, qui l'écrit à la consolidation, et par app.py,
+qui le régénère si le fichier est absent ou périmé.
+"""
+
+import numpy as np
+import pandas as pd
+
+ECHANTILLON_TAILLE = 10_000
+
+# Part maximale du budget réservée aux accidents mortels : en deçà, ils sont tous gardés
+# (totaux de décès exacts) ; au-delà (plusieurs années nationales), ils sont tirés
+PART_MORTELS_MAX = 0.5
+
+def allocate_stratum_quotas(effectifs, budget):
+    """Répartit `budget` tirages entre strates proportionnellement aux effectifs (plafonnés)"""
+    return np.minimum(effectifs, np.ceil(effectifs / max(effectifs.sum(), 1) * budget)).astype(np.int64)
+
+def build_stratified_sample(df, taille=ECHANTILLON_TAILLE, graine=42):
+    """Échantillon stratifié par mois et par mortalité ; dates extrêmes toujours incluses
+
+    Les accidents mortels sont tous gardés (poids 1) tant qu'ils tiennent dans
+    PART_MORTELS_MAX du budget, sinon tirés comme les autres : les accidents non
+    mortels gardent toujours au moins la moitié du budget. La colonne 'poids'
+    (effectif de la strate / effectif tiré) fait des sommes pondérées des estimations
+    sans biais des totaux de la base complète.
+    """
+    n = len(df)
+    mortel = (df['accident_mortel'].to_numpy(dtype=bool) if 'accident_mortel' in df.columns
+              else np.zeros(n, dtype=bool))
+    force = np.zeros(n, dtype=bool)
+    mois = np.zeros(n, dtype=np.int64)
+
+    dates = (pd.to_datetime(df['date'], errors='coerce').reset_index(drop=True)
+             if 'date' in df.columns else pd.Series(dtype='datetime64[ns]'))
+    if dates.notna().any():
+        # Dates extrêmes conservées : l'étendue du filtre de dates reste celle de la base
+        force[[dates.idxmin(), dates.idxmax()]] = True
+        mois = dates.dt.month.fillna(0).to_numpy(dtype=np.int64)
+
+    # Strates : 13 mois (0 = sans date) pour les non mortels, puis 13 pour les mortels
+    strate = mois + 13 * mortel
+    libres = np.flatnonzero(~force)
+    effectifs = np.bincount(strate[libres], minlength=26)
+    budget = max(taille - int(force.sum()), 0)
+    budget_mortels = min(int(effectifs[13:].sum()), int(budget * PART_MORTELS_MAX))
+    quotas = np.concatenate([
+        allocate_stratum_quotas(effectifs[:13], budget - budget_mortels),
+        allocate_stratum_quotas(effectifs[13:], budget_mortels)
+    ])
+
+    # Tirage sans remise : rang d'une clé aléatoire à l'intérieur de chaque strate
+    cle = np.random.default_rng(graine).random(len(libres))
+    ordre = libres[np.lexsort((cle, strate[libres]))]
+    strates_triees = strate[ordre]
+    rang = np.arange(len(ordre)) - np.searchsorted(strates_triees, strates_triees, side='left')
+    tires = ordre[rang < quotas[strates_triees]]
+
+    poids = np.ones(n)
+    poids[libres] = effectifs[strate[libres]] / np.maximum(quotas[strate[libres]], 1)
+    garde = force.copy()
+    garde[tires] = True
+
+    echantillon = df[garde].copy()
+    echantillon['poids'] = poids[garde]
+    return echantillon